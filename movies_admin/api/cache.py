@@ -0,0 +1,134 @@
+import hashlib
+import typing as t
+from uuid import UUID, uuid4
+
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+
+LISTS = 'lists'
+
+
+class ResponseCache:
+    """
+    Rendered responses of the api by the normalized query. A response is
+    stored under its version: a token of all list pages or of the film of
+    a detail page. Invalidation only replaces tokens, old responses are never
+    read again and go away by TTL or LRU of the cache backend.
+    """
+
+    def __init__(self, alias: str = 'api'):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def get_version_key(name: str) -> str:
+        return f'api:version:{name}'
+
+    def get_version(self, name: str) -> str:
+        key = self.get_version_key(name)
+        version = self.cache.get(key)
+
+        if version is None:
+            # Токен мог вытеснить LRU, старые ответы с ним читать уже нельзя.
+            self.cache.add(key, uuid4().hex, None)
+            version = self.cache.get(key)
+
+        return version
+
+    @staticmethod
+    def get_etag(view: str, params: t.Dict[str, str], version: str) -> str:
+        query = '&'.join(f'{key}={value}' for key, value in sorted(params.items()))
+        return hashlib.md5(f'{view}?{query}#{version}'.encode()).hexdigest()
+
+    def get(self, etag: str) -> t.Optional[t.Tuple[bytes, str]]:
+        return self.cache.get(f'api:response:{etag}')
+
+    def set(self, etag: str, content: bytes, content_type: str) -> None:
+        self.cache.set(f'api:response:{etag}', (content, content_type))
+
+    def invalidate(self, film_work_ids: t.Iterable[t.Any], lists: bool = True) -> None:
+        """New versions of the films and of list pages after the commit."""
+        names = [str(i) for i in film_work_ids]
+
+        if lists:
+            names.append(LISTS)
+
+        if names:
+            transaction.on_commit(
+                lambda: self.cache.set_many(
+                    {self.get_version_key(i): uuid4().hex for i in names}, None
+                )
+            )
+
+
+response_cache = ResponseCache()
+
+
+class CachedResponseMixin:
+    """
+    Cache json responses of list and retrieve, see ResponseCache. Objects
+    have uuid keys, a detail page has the version of its object. A request
+    with the ETag of the current version gets 304 before the queryset is
+    even built. Permissions are checked before the cache as usual.
+    """
+
+    response_cache = response_cache
+
+    def get_cache_params(self, request) -> t.Dict[str, str]:
+        """Query params that change the response, normalized."""
+        return {key: value for key, value in request.query_params.items() if value}
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(LISTS, super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            pk = str(UUID(kwargs[self.lookup_url_kwarg or self.lookup_field]))
+        except ValueError:
+            return super().retrieve(request, *args, **kwargs)
+
+        return self.get_cached_response(pk, super().retrieve, request, *args, **kwargs)
+
+    def get_cached_response(self, version_name: str, handler, request, *args, **kwargs):
+        # В html browsable api есть имя пользователя и csrf токен.
+        if request.accepted_renderer.format != 'json':
+            return handler(request, *args, **kwargs)
+
+        version = self.response_cache.get_version(version_name)
+        etag = self.response_cache.get_etag(
+            f'{self.basename}-{self.action}-{version_name}',
+            self.get_cache_params(request),
+            version,
+        )
+        quoted_etag = quote_etag(etag)
+
+        if quoted_etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+            response['ETag'] = quoted_etag
+            return response
+
+        cached = self.response_cache.get(etag)
+
+        if cached is not None:
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            response['ETag'] = quoted_etag
+            return response
+
+        response = handler(request, *args, **kwargs)
+
+        if response.status_code == status.HTTP_200_OK:
+            response['ETag'] = quoted_etag
+            response.add_post_render_callback(
+                lambda rendered: self.response_cache.set(
+                    etag, rendered.content, rendered['Content-Type']
+                )
+            )
+
+        return response
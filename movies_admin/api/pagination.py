@@ -1,19 +1,191 @@
-from django.core.paginator import EmptyPage
+import hashlib
+import json
+import math
+import typing as t
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connections, models
+from django.db.models import Q, QuerySet
+from django.utils.translation import gettext_lazy as _
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import _reverse_ordering
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
-class PrimitivePagination(pagination.PageNumberPagination):
-    def get_paginated_response(self, data):
+class Cursor(t.NamedTuple):
+    reverse: bool
+    position: t.List[t.Any]
+
+
+class CountMode(models.TextChoices):
+    """How KeysetPagination counts rows of the filtered queryset."""
+
+    # COUNT(*) on every page
+    EXACT = 'exact', _('exact')
+    # COUNT(*) up to exact_count_limit rows, planner statistics above it
+    ESTIMATED = 'estimated', _('estimated')
+    # COUNT(*) cached by the query for count_cache_timeout seconds
+    CACHED = 'cached', _('cached')
+
+
+class KeysetPagination(pagination.CursorPagination):
+    """
+    Pages follow the ordering, its last field is unique. The next page is read
+    after the position of the last row of the page, e.g. WHERE id > last id
+    by the index, so a deep page costs as much as the first one. The response
+    has count, total_pages, prev, next and results, prev and next are cursors
+    for the cursor query param instead of page numbers.
+    """
+
+    ordering = ('id', )
+    count_mode = CountMode(settings.API_COUNT_MODE)
+    count_cache_timeout = settings.API_COUNT_CACHE_TIMEOUT
+    exact_count_limit = 10000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = self.get_count(queryset)
+        self.page_size = self.get_page_size(request)
+
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse, position = self.cursor or (False, None)
+
+        # Страница назад читается в обратном порядке от своей первой строки.
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.get_position_filter(ordering, position))
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following = len(results) > len(self.page)
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_following
+        else:
+            self.has_next, self.has_previous = has_following, position is not None
+
+        self.previous_position = self.get_position(self.page[0]) if self.page else position
+        self.next_position = self.get_position(self.page[-1]) if self.page else position
+        self.display_page_controls = self.has_previous or self.has_next
+
+        return self.page
+
+    def get_count(self, queryset: QuerySet) -> int:
+        if self.count_mode == CountMode.EXACT:
+            return queryset.count()
+
+        if self.count_mode == CountMode.CACHED:
+            query = str(queryset.order_by().query).encode()
+            key = f'api:count:{hashlib.md5(query).hexdigest()}'
+            return cache.get_or_set(key, queryset.count, self.count_cache_timeout)
+
+        # Точный count ограничен, дальше число строк из статистики планировщика.
+        count = queryset[:self.exact_count_limit + 1].count()
+
+        if count <= self.exact_count_limit:
+            return count
+
+        return max(self.estimate_count(queryset), count)
+
+    @staticmethod
+    def estimate_count(queryset: QuerySet) -> int:
+        connection = connections[queryset.db]
+
+        with connection.cursor() as cursor:
+            if not queryset.query.where:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                    (queryset.model._meta.db_table, ),
+                )
+                return cursor.fetchone()[0]
+
+            sql, params = queryset.order_by().query.sql_with_params()
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            return int(cursor.fetchone()[0][0]['Plan']['Plan Rows'])
+
+    def get_position(self, instance) -> t.List[t.Any]:
+        # Страница может быть и из словарей .values(), как в CursorPagination.
+        if isinstance(instance, dict):
+            return [instance[i.lstrip('-')] for i in self.ordering]
+
+        return [getattr(instance, i.lstrip('-')) for i in self.ordering]
+
+    @staticmethod
+    def get_position_filter(ordering: t.Sequence[str], position: t.Sequence[t.Any]) -> Q:
+        """Rows after the position in the ordering: a > x OR a = x AND b > y."""
+        after, equal = Q(), Q()
+
+        for field, value in zip(ordering, position):
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            after |= equal & Q(**{f'{field.lstrip("-")}__{lookup}': value})
+            equal &= Q(**{field.lstrip('-'): value})
+
+        return after
+
+    def decode_cursor(self, request) -> t.Optional[Cursor]:
+        encoded = request.query_params.get(self.cursor_query_param)
+
+        if encoded is None:
+            return None
+
         try:
-            next_page_number = self.page.next_page_number()
-        except EmptyPage:
-            next_page_number = None
+            reverse, position = json.loads(urlsafe_b64decode(encoded.encode()))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
 
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        return Cursor(bool(reverse), position)
+
+    def encode_cursor(self, cursor: Cursor) -> str:
+        # Ссылка целиком не нужна, клиент передает курсор как раньше номер страницы.
+        return urlsafe_b64encode(json.dumps(cursor, default=str).encode()).decode()
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        return self.encode_cursor(Cursor(False, self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+
+        return self.encode_cursor(Cursor(True, self.previous_position))
+
+    def get_html_context(self):
+        return {
+            'previous_url': self.get_url(self.get_previous_link()),
+            'next_url': self.get_url(self.get_next_link()),
+        }
+
+    def get_url(self, cursor):
+        if cursor is None:
+            return None
+
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
         return Response({
-            'count': self.page.paginator.count,
-            'total_pages': self.page.paginator.num_pages,
-            'prev': self.page.previous_page_number() if self.page.has_previous() else None,
-            'next': next_page_number,
+            'count': self.count,
+            'total_pages': math.ceil(self.count / self.page_size),
+            'prev': self.get_previous_link(),
+            'next': self.get_next_link(),
             'results': data,
         })
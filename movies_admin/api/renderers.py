@@ -0,0 +1,51 @@
+import re
+
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+# Числа, которые orjson пишет не так, как json: 1e16 вместо 1e+16 и
+# 0.00001 вместо 1e-05. Такое же место в строке только отдает ответ json.
+FLOAT_EXPONENT = re.compile(rb'e-?\d+[,\]}]')
+FLOAT_SMALL = b'.0000'
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer with orjson for compact json, several times faster. The
+    output is byte for byte the one of JSONRenderer: date and time types go
+    through the same encoder_class, and the rare response orjson can't
+    encode the same way is rendered by JSONRenderer. Indented json, e.g. of
+    the browsable api, and non default JSON settings are left to it as well.
+    The only difference: NaN and inf are written as null, while JSONRenderer
+    raises ValueError, so serializers check their floats, see
+    api.v1.serializers.check_finite.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+
+        if indent is not None or self.ensure_ascii or not self.compact or not self.strict:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Ответы api - словари и списки, число вне них FLOAT_EXPONENT не найдет.
+        if not isinstance(data, (dict, list)):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except orjson.JSONEncodeError:
+            # Например, int больше 64 бит или ключи словаря не строки.
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if FLOAT_SMALL in ret or FLOAT_EXPONENT.search(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Как в JSONRenderer, json должен оставаться подмножеством javascript.
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
@@ -0,0 +1,58 @@
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import models
+from django.db.models import F, Func, Q, QuerySet, Subquery
+from django.db.models.functions import Cast
+
+from movies.models import PersonFilmWork
+
+# Та же конфигурация, что у search_vector в миграции 0003_search, иначе
+# GIN индекс не подойдет для запроса.
+SEARCH_CONFIG = 'english'
+
+
+class ArraySubquery(Subquery):
+    """ARRAY() of a one column subquery, Django 3.2 doesn't have it yet."""
+
+    template = 'ARRAY(%(subquery)s)'
+
+    def __init__(self, queryset, output_field=None, **extra):
+        super().__init__(
+            queryset,
+            output_field=output_field or ArrayField(models.CharField()),
+            **extra
+        )
+
+
+class EqualsAny(Func):
+    """
+    lhs = ANY(array). With an ArraySubquery the subquery runs once before the
+    query and the condition can use an index of lhs, even inside OR, unlike
+    IN (subquery).
+    """
+
+    arg_joiner = ' = ANY('
+    template = '(%(expressions)s))'
+    output_field = models.BooleanField()
+
+
+def search_film_works(queryset: QuerySet, search: str) -> QuerySet:
+    """
+    Films of FilmWorkRead matching the websearch query by search_vector or
+    with persons of similar names by trigrams, annotated with rank.
+    """
+    query = SearchQuery(search, config=SEARCH_CONFIG, search_type='websearch')
+    persons_film_works = ArraySubquery(
+        PersonFilmWork.objects
+        .filter(person__full_name__trigram_similar=search)
+        .values('film_work'),
+        output_field=ArrayField(models.UUIDField()),
+    )
+
+    # Оба условия идут по GIN индексам, BitmapOr объединяет их.
+    return queryset.filter(
+        Q(search_vector=query) | Q(EqualsAny(F('pk'), persons_film_works))
+    ).annotate(
+        # float4 ранга как float8, чтобы позиция курсора сравнивалась точно.
+        rank=Cast(SearchRank(F('search_vector'), query), models.FloatField())
+    )
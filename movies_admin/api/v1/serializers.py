@@ -1,16 +1,33 @@
+import math
+
+from django.db import models
 from rest_framework import serializers
 
-from movies.models import FilmWork
+from movies.models import FilmWorkRead
+
+
+def check_finite(value):
+    """Fail on NaN and inf the same way as the strict JSONRenderer."""
+    if value is not None and not math.isfinite(value):
+        raise ValueError('Out of range float values are not JSON compliant')
+
+    return value
+
+
+class FiniteFloatField(serializers.FloatField):
+    def to_representation(self, value):
+        return check_finite(super().to_representation(value))
 
 
 class FilmWorkSerializer(serializers.ModelSerializer):
-    genres = serializers.SerializerMethodField()
-    actors = serializers.SerializerMethodField()
-    directors = serializers.SerializerMethodField()
-    writers = serializers.SerializerMethodField()
+    # ORJSONRenderer записал бы NaN и inf как null.
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        models.FloatField: FiniteFloatField,
+    }
 
     class Meta:
-        model = FilmWork
+        model = FilmWorkRead
         fields = (
             'id',
             'title',
@@ -25,14 +42,26 @@ class FilmWorkSerializer(serializers.ModelSerializer):
             'writers',
         )
 
-    def get_genres(self, obj):
-        return obj.genres_names
 
-    def get_actors(self, obj):
-        return obj.actors
+class FilmWorkRowSerializer(serializers.BaseSerializer):
+    """
+    Read only FilmWorkSerializer for rows of .values() with its fields, no
+    model instances and no per field to_representation. Values go to the
+    response as psycopg2 returns them, uuid and date are encoded by the
+    renderer the same way as by the fields of FilmWorkSerializer. Floats are
+    checked as by its FiniteFloatField.
+    """
+
+    field_names = FilmWorkSerializer.Meta.fields
+    float_field_names = tuple(
+        name
+        for name in field_names
+        if isinstance(FilmWorkRead._meta.get_field(name), models.FloatField)
+    )
 
-    def get_directors(self, obj):
-        return obj.directors
+    def to_representation(self, row):
+        for name in self.float_field_names:
+            check_finite(row[name])
 
-    def get_writers(self, obj):
-        return obj.writers
+        # В строке могут быть и колонки для пагинации, например rank.
+        return {name: row[name] for name in self.field_names}
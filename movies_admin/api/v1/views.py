@@ -1,49 +1,158 @@
-from django.contrib.postgres.aggregates import ArrayAgg
-from django.db.models import Q, QuerySet
+import typing as t
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, QuerySet
+from django.http import StreamingHttpResponse
 from django_filters import rest_framework as filters
 from rest_framework import viewsets
+from rest_framework.decorators import action
 from rest_framework.filters import SearchFilter
+from rest_framework.serializers import BaseSerializer
+
+from api.cache import CachedResponseMixin
+from api.renderers import ORJSONRenderer
+from api.v1.queries import search_film_works
+from api.v1.serializers import FilmWorkRowSerializer, FilmWorkSerializer
+from movies.models import FilmWorkRead, GenreFilmWork
+
+
+class FilmWorkSearchFilter(SearchFilter):
+    """
+    Full text search by search_vector of FilmWorkRead with the title weighted
+    above the description, plus films of persons with similar names by
+    trigrams. Found films go by SearchRank, the best first.
+    """
+
+    def get_search(self, request) -> str:
+        # Порядок слов важен для websearch: "a or b c" и "a b or c" разные.
+        return ' '.join(self.get_search_terms(request)).lower()
+
+    def filter_queryset(self, request, queryset, view):
+        search = self.get_search(request)
+
+        if not search:
+            return queryset
+
+        return search_film_works(queryset, search)
+
+    def get_ordering(self, request, queryset, view):
+        """Ordering for KeysetPagination, the rank one only with a search."""
+        if self.get_search(request):
+            return ('-rank', 'id')
 
-from api.v1.serializers import FilmWorkSerializer
-from movies.models import FilmWork, FilmWorkPersonRole
+        return view.paginator.ordering
 
 
 class FilmWorkFilter(filters.FilterSet):
-    genres = filters.CharFilter(
-        field_name="genrefilmwork__genre__name", lookup_expr='icontains'
-    )
+    genres = filters.CharFilter(method='filter_genres')
 
     class Meta:
-        model = FilmWork
+        model = FilmWorkRead
         fields = ('genres', )
 
+    @staticmethod
+    def filter_genres(queryset: QuerySet, name: str, value: str) -> QuerySet:
+        # EXISTS вместо join, чтобы фильм с несколькими подходящими жанрами
+        # не размножался в выдаче. Опечатки находит сходство по триграммам,
+        # оба условия идут по триграммному индексу названия.
+        return queryset.filter(
+            Exists(
+                GenreFilmWork.objects.filter(
+                    Q(genre__name__icontains=value)
+                    | Q(genre__name__trigram_similar=value),
+                    film_work=OuterRef('pk'),
+                )
+            )
+        )
+
+
+class FilmWorkExportFilter(filters.FilterSet):
+    updated_since = filters.IsoDateTimeFilter(field_name='updated_at', lookup_expr='gte')
+
+    class Meta:
+        model = FilmWorkRead
+        fields = ('updated_since', )
 
-class FilmWorkViewSet(viewsets.ReadOnlyModelViewSet):
+
+def iter_ndjson(
+    queryset: QuerySet, serializer: BaseSerializer, chunk_size: int
+) -> t.Iterator[bytes]:
+    """
+    Rows of the queryset through the serializer as json lines, one chunk of
+    lines per fetch of the server side cursor.
+    """
+    renderer = ORJSONRenderer()
+
+    # Вне транзакции курсор объявляется WITH HOLD, и postgres на коммите
+    # сохраняет весь результат, прежде чем отдать первую строку.
+    with transaction.atomic(using=queryset.db):
+        rows = queryset.iterator(chunk_size=chunk_size)
+
+        while True:
+            lines = [
+                renderer.render(serializer.to_representation(row)) + b'\n'
+                for row in islice(rows, chunk_size)
+            ]
+
+            if not lines:
+                return
+
+            yield b''.join(lines)
+
+
+class FilmWorkViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
+    # Жанры и персоны уже собраны в строке фильма, см. FilmWorkRead.
+    queryset = FilmWorkRead.objects.defer('search_vector')
     serializer_class = FilmWorkSerializer
-    filter_backends = (SearchFilter, filters.DjangoFilterBackend)
-    search_fields = ('title', 'description')
+    filter_backends = (FilmWorkSearchFilter, filters.DjangoFilterBackend)
     filterset_class = FilmWorkFilter
 
-    def get_queryset(self) -> QuerySet:
-        return (
-            FilmWork.objects
-            .prefetch_related('genres', 'persons')
-            .annotate(
-                genres_names=ArrayAgg(
-                    'genrefilmwork__genre__name',
-                    distinct=True
-                ),
-                actors=self._aggregate_person(FilmWorkPersonRole.ACTOR),
-                directors=self._aggregate_person(FilmWorkPersonRole.DIRECTOR),
-                writers=self._aggregate_person(FilmWorkPersonRole.WRITER),
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+
+        if self.action == 'list':
+            # Страница списка читается словарями .values() без экземпляров моделей,
+            # аннотации вроде rank нужны пагинации.
+            queryset = queryset.values(
+                *FilmWorkRowSerializer.field_names, *queryset.query.annotations
             )
-            .all()
-        )
 
-    @staticmethod
-    def _aggregate_person(role: FilmWorkPersonRole) -> ArrayAgg:
-        return ArrayAgg(
-            'personfilmwork__person__full_name',
-            filter=Q(personfilmwork__role=role),
-            distinct=True
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return FilmWorkRowSerializer
+
+        return super().get_serializer_class()
+
+    @action(
+        detail=False,
+        filter_backends=(filters.DjangoFilterBackend, ),
+        filterset_class=FilmWorkExportFilter,
+        pagination_class=None,
+    )
+    def export(self, request):
+        """
+        All films as NDJSON, one line per film as in the list, in one pass of
+        a server side cursor and in memory independent of the number of
+        films. updated_since keeps the films changed since the time. Deleted
+        films aren't exported.
+        """
+        queryset = self.filter_queryset(self.get_queryset()).values(
+            *FilmWorkRowSerializer.field_names
         )
+        return StreamingHttpResponse(
+            iter_ndjson(queryset, FilmWorkRowSerializer(), settings.API_EXPORT_CHUNK_SIZE),
+            content_type='application/x-ndjson',
+        )
+
+    def get_cache_params(self, request) -> t.Dict[str, str]:
+        # Поиск и жанры ищутся без учета регистра.
+        params = {
+            'search': FilmWorkSearchFilter().get_search(request),
+            'genres': request.query_params.get('genres', '').lower(),
+            'cursor': request.query_params.get(self.paginator.cursor_query_param, ''),
+        }
+        return {key: value for key, value in params.items() if value}
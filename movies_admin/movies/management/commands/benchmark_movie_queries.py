@@ -0,0 +1,262 @@
+import statistics
+
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db import models
+from django.db.models import OuterRef, Q, QuerySet, Subquery
+from django.db.models.functions import JSONObject
+from django.test.utils import CaptureQueriesContext
+
+from api.v1.queries import ArraySubquery, search_film_works
+from api.v1.views import FilmWorkFilter
+from movies.models import (
+    FilmWork,
+    FilmWorkPersonRole,
+    FilmWorkRead,
+    GenreFilmWork,
+    Person,
+    PersonFilmWork,
+)
+
+# Способы собрать жанры и персоны фильма из таблиц связей, до FilmWorkRead.
+# GROUP BY по join всех связей, как было до стратегий, для сравнения.
+JOIN = 'join'
+# ARRAY(SELECT ...) для жанров и для каждой роли.
+SUBQUERY = 'subquery'
+# ARRAY(SELECT ...) для жанров, один json объект персон по ролям.
+JSON = 'json'
+# Готовые строки FilmWorkRead, их читает API.
+READ_MODEL = 'read_model'
+STRATEGIES = (JOIN, SUBQUERY, JSON, READ_MODEL)
+
+
+def annotate_by_join(queryset: QuerySet) -> QuerySet:
+    return queryset.annotate(
+        genres_names=ArrayAgg('genrefilmwork__genre__name', distinct=True),
+        **{
+            f'{role}s': ArrayAgg(
+                'personfilmwork__person__full_name',
+                filter=Q(personfilmwork__role=role),
+                distinct=True,
+            )
+            for role in FilmWorkPersonRole.values
+        }
+    )
+
+
+def genres_subquery() -> ArraySubquery:
+    return ArraySubquery(
+        GenreFilmWork.objects
+        .filter(film_work=OuterRef('pk'))
+        .order_by('genre__name')
+        .values('genre__name')
+        .distinct()
+    )
+
+
+def persons_subquery(role: FilmWorkPersonRole) -> ArraySubquery:
+    return ArraySubquery(
+        PersonFilmWork.objects
+        .filter(film_work=OuterRef('pk'), role=role)
+        .order_by('person__full_name')
+        .values('person__full_name')
+        .distinct()
+    )
+
+
+def roles_subquery() -> Subquery:
+    """Json object with sorted names of persons of the film by their roles."""
+    return Subquery(
+        PersonFilmWork.objects
+        .filter(film_work=OuterRef('pk'))
+        .values('film_work')
+        .annotate(
+            roles=JSONObject(**{
+                role: ArrayAgg(
+                    'person__full_name', filter=Q(role=role), distinct=True
+                )
+                for role in FilmWorkPersonRole.values
+            })
+        )
+        .values('roles'),
+        output_field=models.JSONField(),
+    )
+
+
+def annotate_by_subqueries(queryset: QuerySet, strategy: str) -> QuerySet:
+    """
+    Annotate genres_names and persons of films. Both strategies read link rows
+    of every film on its own by the film_work_id index, the subquery one gives
+    actors, directors and writers, the json one gives roles by role values.
+    """
+    queryset = queryset.annotate(genres_names=genres_subquery())
+
+    if strategy == JSON:
+        return queryset.annotate(roles=roles_subquery())
+
+    return queryset.annotate(
+        actors=persons_subquery(FilmWorkPersonRole.ACTOR),
+        directors=persons_subquery(FilmWorkPersonRole.DIRECTOR),
+        writers=persons_subquery(FilmWorkPersonRole.WRITER),
+    )
+
+
+def read_after(queryset: QuerySet, page: int, page_size: int) -> list:
+    """Page as KeysetPagination reads it, after the last id of the previous page."""
+    queryset = queryset.order_by('pk')
+
+    if page > 1:
+        last_id = queryset.values_list('pk', flat=True)[(page - 1) * page_size - 1]
+        queryset = queryset.filter(pk__gt=last_id)
+
+    return list(queryset[:page_size])
+
+
+class Command(BaseCommand):
+    help = (
+        'EXPLAIN ANALYZE queries of the movies API on the read model and with '
+        'every aggregation strategy. Load a big dataset first, e.g. generate it with '
+        '"python -m benchmark generate" of sqlite_to_postgres and run the etl. '
+        '--cast-size adds persons to films in a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--strategies',
+            nargs='+',
+            default=STRATEGIES,
+            choices=STRATEGIES,
+        )
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument(
+            '--pages', nargs='+', type=int, default=[1, 100], help='Pages to read'
+        )
+        parser.add_argument('--search', default='star')
+        parser.add_argument('--genres', default='drama')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--cast-size', type=int, default=0, help='Actors of every big cast film'
+        )
+        parser.add_argument('--cast-films', type=int, default=1000)
+        parser.add_argument(
+            '--plans', action='store_true', help='Print the text plans'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                # Иначе seq scan большой таблицы начинается там, где сейчас
+                # читает другой, и первые страницы каждый раз разные.
+                cursor.execute('SET LOCAL synchronize_seqscans = off')
+
+            if options['cast_size']:
+                self.grow_casts(options['cast_films'], options['cast_size'])
+
+            for strategy in options['strategies']:
+                for scenario, run in self.get_scenarios(strategy, options):
+                    self.explain(strategy, scenario, run, options)
+
+            # Большие касты нужны только на время замеров.
+            transaction.set_rollback(True)
+
+    def grow_casts(self, films: int, cast_size: int) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                INSERT INTO {PersonFilmWork._meta.db_table}
+                (id, film_work_id, person_id, role, created_at)
+                SELECT gen_random_uuid(), film_work.id, person.id, %s, now()
+                FROM (
+                    -- Без сортировки это фильмы первых страниц.
+                    SELECT id FROM {FilmWork._meta.db_table} LIMIT %s
+                ) film_work
+                CROSS JOIN (
+                    SELECT id FROM {Person._meta.db_table} ORDER BY id LIMIT %s
+                ) person
+                ON CONFLICT DO NOTHING
+                ''',
+                (FilmWorkPersonRole.ACTOR.value, films, cast_size),
+            )
+            self.stdout.write(f'{cursor.rowcount} actors are added to {films} films')
+            cursor.execute(f'ANALYZE {PersonFilmWork._meta.db_table}')
+
+    @staticmethod
+    def get_scenarios(strategy: str, options):
+        if strategy == JOIN:
+            queryset = annotate_by_join(FilmWork.objects.all())
+            filtered = queryset.filter(
+                genrefilmwork__genre__name__icontains=options['genres']
+            )
+        elif strategy == READ_MODEL:
+            queryset = FilmWorkRead.objects.all()
+            filtered = FilmWorkFilter.filter_genres(
+                queryset, 'genres', options['genres']
+            )
+        else:
+            queryset = annotate_by_subqueries(FilmWork.objects.all(), strategy)
+            filtered = FilmWorkFilter.filter_genres(
+                queryset, 'genres', options['genres']
+            )
+
+        page_size = options['page_size']
+
+        if strategy == READ_MODEL:
+            search = search_film_works(queryset, options['search']).order_by('-rank', 'pk')
+        else:
+            search = queryset.filter(
+                Q(title__icontains=options['search'])
+                | Q(description__icontains=options['search'])
+            )
+        scenarios = [
+            (
+                f'page {page}',
+                # Значение по умолчанию фиксирует page в замыкании.
+                lambda page=page: list(
+                    queryset[(page - 1) * page_size:page * page_size]
+                ),
+            )
+            for page in options['pages']
+        ]
+        keyset_scenarios = [
+            (
+                f'keyset {page}',
+                lambda page=page: read_after(queryset, page, page_size),
+            )
+            for page in options['pages']
+        ]
+
+        return [
+            *scenarios,
+            *keyset_scenarios,
+            ('count', queryset.count),
+            ('search', lambda: list(search[:page_size])),
+            ('genres', lambda: list(filtered[:page_size])),
+        ]
+
+    def explain(self, strategy: str, scenario: str, run, options) -> None:
+        # SQL берем таким, каким его выполнил драйвер, вместе с параметрами.
+        with CaptureQueriesContext(connection) as context:
+            run()
+
+        sql = context.captured_queries[-1]['sql']
+        plans = []
+
+        with connection.cursor() as cursor:
+            for _ in range(options['repeat']):
+                cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}')
+                plans.append(cursor.fetchone()[0][0])
+
+        plan = plans[-1]['Plan']
+        self.stdout.write(
+            f'{strategy:>10} {scenario:>10}: '
+            f'execution {statistics.median(i["Execution Time"] for i in plans):9.2f} ms, '
+            f'planning {statistics.median(i["Planning Time"] for i in plans):6.2f} ms, '
+            f'buffers {plan["Shared Hit Blocks"] + plan["Shared Read Blocks"]:8}, '
+            f'rows {plan["Actual Rows"]}'
+        )
+
+        if options['plans']:
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) {sql}')
+                self.stdout.write('\n'.join(i[0] for i in cursor.fetchall()))
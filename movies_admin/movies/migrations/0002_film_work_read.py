@@ -0,0 +1,323 @@
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+# Жанры и персоны фильма берутся отдельными подзапросами по индексу
+# film_work_id, без размножения строк жанры x персоны.
+FILM_WORK_READ_COLUMNS = '''
+    film_work.id,
+    film_work.title,
+    film_work.description,
+    film_work.creation_date,
+    film_work.rating,
+    film_work.type,
+    film_work.subscription_required
+'''
+
+# Столбцы называются явно: следующие миграции добавляют в таблицу свои.
+FILM_WORK_READ_FIELDS = '''
+    id,
+    title,
+    description,
+    creation_date,
+    rating,
+    type,
+    subscription_required,
+    genres,
+    actors,
+    directors,
+    writers
+'''
+
+
+def persons_subquery(role: str) -> str:
+    return f'''
+    ARRAY(
+        SELECT DISTINCT person.full_name
+        FROM content.person_film_work
+        JOIN content.person ON person.id = person_film_work.person_id
+        WHERE person_film_work.film_work_id = film_work.id
+          AND person_film_work.role = '{role}'
+        ORDER BY person.full_name
+    )
+    '''
+
+
+def persons_aggregate(role: str) -> str:
+    return f'''
+    coalesce(
+        array_agg(DISTINCT person.full_name)
+        FILTER (WHERE person_film_work.role = '{role}'),
+        '{{}}'
+    ) AS {role}s
+    '''
+
+
+SQL = f'''
+CREATE TABLE content.film_work_read (
+    id uuid PRIMARY KEY,
+    title varchar(255) NOT NULL,
+    description text,
+    creation_date date,
+    rating double precision,
+    type varchar(20) NOT NULL,
+    subscription_required boolean,
+    genres varchar(255)[] NOT NULL DEFAULT '{{}}',
+    actors varchar(255)[] NOT NULL DEFAULT '{{}}',
+    directors varchar(255)[] NOT NULL DEFAULT '{{}}',
+    writers varchar(255)[] NOT NULL DEFAULT '{{}}'
+);
+
+-- Триггеры жанров и персон ищут их фильмы. Django считает, что индексы
+-- по форен кеям уже есть, но таблицы создает init.sql, а не миграции.
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_index
+        WHERE indrelid = 'content.genre_film_work'::regclass
+          AND indkey[0] = (
+              SELECT attnum FROM pg_attribute
+              WHERE attrelid = 'content.genre_film_work'::regclass
+                AND attname = 'genre_id'
+          )
+    ) THEN
+        CREATE INDEX genre_film_work_genre_id_idx
+        ON content.genre_film_work (genre_id);
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_index
+        WHERE indrelid = 'content.person_film_work'::regclass
+          AND indkey[0] = (
+              SELECT attnum FROM pg_attribute
+              WHERE attrelid = 'content.person_film_work'::regclass
+                AND attname = 'person_id'
+          )
+    ) THEN
+        CREATE INDEX person_film_work_person_id_idx
+        ON content.person_film_work (person_id);
+    END IF;
+END
+$$;
+
+-- NULL пересобирает всю таблицу.
+CREATE FUNCTION content.refresh_film_work_read(film_work_ids uuid[] DEFAULT NULL)
+RETURNS void AS $$
+BEGIN
+    IF film_work_ids IS NULL THEN
+        TRUNCATE content.film_work_read;
+
+        INSERT INTO content.film_work_read ({FILM_WORK_READ_FIELDS})
+        SELECT
+            {FILM_WORK_READ_COLUMNS},
+            coalesce(genres.genres, '{{}}'),
+            coalesce(persons.actors, '{{}}'),
+            coalesce(persons.directors, '{{}}'),
+            coalesce(persons.writers, '{{}}')
+        FROM content.film_work
+        LEFT JOIN (
+            SELECT genre_film_work.film_work_id,
+                   array_agg(DISTINCT genre.name) AS genres
+            FROM content.genre_film_work
+            JOIN content.genre ON genre.id = genre_film_work.genre_id
+            GROUP BY genre_film_work.film_work_id
+        ) genres ON genres.film_work_id = film_work.id
+        LEFT JOIN (
+            SELECT person_film_work.film_work_id,
+                   {persons_aggregate('actor')},
+                   {persons_aggregate('director')},
+                   {persons_aggregate('writer')}
+            FROM content.person_film_work
+            JOIN content.person ON person.id = person_film_work.person_id
+            GROUP BY person_film_work.film_work_id
+        ) persons ON persons.film_work_id = film_work.id;
+
+        RETURN;
+    END IF;
+
+    -- Пересчеты одного фильма идут по очереди: следующий ждет коммита
+    -- предыдущего и видит его связи.
+    PERFORM 1 FROM content.film_work
+    WHERE id = ANY(film_work_ids)
+    ORDER BY id
+    FOR NO KEY UPDATE;
+
+    DELETE FROM content.film_work_read
+    WHERE id = ANY(film_work_ids)
+      AND NOT EXISTS (
+          SELECT 1 FROM content.film_work
+          WHERE film_work.id = film_work_read.id
+      );
+
+    INSERT INTO content.film_work_read ({FILM_WORK_READ_FIELDS})
+    SELECT
+        {FILM_WORK_READ_COLUMNS},
+        ARRAY(
+            SELECT DISTINCT genre.name
+            FROM content.genre_film_work
+            JOIN content.genre ON genre.id = genre_film_work.genre_id
+            WHERE genre_film_work.film_work_id = film_work.id
+            ORDER BY genre.name
+        ),
+        {persons_subquery('actor')},
+        {persons_subquery('director')},
+        {persons_subquery('writer')}
+    FROM content.film_work
+    WHERE film_work.id = ANY(film_work_ids)
+    ON CONFLICT (id) DO UPDATE SET
+        title = EXCLUDED.title,
+        description = EXCLUDED.description,
+        creation_date = EXCLUDED.creation_date,
+        rating = EXCLUDED.rating,
+        type = EXCLUDED.type,
+        subscription_required = EXCLUDED.subscription_required,
+        genres = EXCLUDED.genres,
+        actors = EXCLUDED.actors,
+        directors = EXCLUDED.directors,
+        writers = EXCLUDED.writers;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Триггеры уровня выражения: пачка COPY или bulk_create пересчитывает
+-- свои фильмы одним запросом. Загрузка, которая потом пересобирает таблицу
+-- целиком, выключает их через SET content.film_work_read_sync = off.
+CREATE FUNCTION content.sync_film_work_read() RETURNS trigger AS $$
+DECLARE
+    film_work_ids uuid[];
+    row_ids uuid[];
+BEGIN
+    IF current_setting('content.film_work_read_sync', true) = 'off' THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'TRUNCATE' THEN
+        IF TG_TABLE_NAME = 'film_work' THEN
+            TRUNCATE content.film_work_read;
+        ELSE
+            PERFORM content.refresh_film_work_read();
+        END IF;
+
+        RETURN NULL;
+    END IF;
+
+    IF TG_TABLE_NAME = 'film_work' AND TG_OP = 'DELETE' THEN
+        DELETE FROM content.film_work_read
+        WHERE id IN (SELECT id FROM old_rows);
+
+        RETURN NULL;
+    END IF;
+
+    IF TG_TABLE_NAME = 'film_work' THEN
+        film_work_ids := ARRAY(SELECT id FROM new_rows);
+    ELSIF TG_TABLE_NAME IN ('genre_film_work', 'person_film_work') THEN
+        IF TG_OP = 'INSERT' THEN
+            film_work_ids := ARRAY(SELECT DISTINCT film_work_id FROM new_rows);
+        ELSIF TG_OP = 'DELETE' THEN
+            film_work_ids := ARRAY(SELECT DISTINCT film_work_id FROM old_rows);
+        ELSE
+            film_work_ids := ARRAY(
+                SELECT film_work_id FROM new_rows
+                UNION
+                SELECT film_work_id FROM old_rows
+            );
+        END IF;
+    ELSE
+        IF TG_OP = 'DELETE' THEN
+            row_ids := ARRAY(SELECT id FROM old_rows);
+        ELSE
+            row_ids := ARRAY(SELECT id FROM new_rows);
+        END IF;
+
+        -- Связи могут прийти раньше жанра или персоны, поэтому новые
+        -- тоже ищем в фильмах.
+        IF TG_TABLE_NAME = 'genre' THEN
+            film_work_ids := ARRAY(
+                SELECT DISTINCT film_work_id FROM content.genre_film_work
+                WHERE genre_id = ANY(row_ids)
+            );
+        ELSE
+            film_work_ids := ARRAY(
+                SELECT DISTINCT film_work_id FROM content.person_film_work
+                WHERE person_id = ANY(row_ids)
+            );
+        END IF;
+    END IF;
+
+    IF film_work_ids <> '{{}}' THEN
+        PERFORM content.refresh_film_work_read(film_work_ids);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+'''
+
+TABLES = ('film_work', 'genre_film_work', 'person_film_work', 'genre', 'person')
+
+# У триггера с таблицами переходов может быть только одно событие.
+TRIGGERS = '\n'.join(
+    f'''
+    CREATE TRIGGER film_work_read_{event.lower()}
+    AFTER {event} ON content.{table}
+    REFERENCING {rows}
+    FOR EACH STATEMENT EXECUTE FUNCTION content.sync_film_work_read();
+    '''
+    for table in TABLES
+    for event, rows in (
+        ('INSERT', 'NEW TABLE AS new_rows'),
+        ('UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows'),
+        ('DELETE', 'OLD TABLE AS old_rows'),
+    )
+) + '\n'.join(
+    f'''
+    CREATE TRIGGER film_work_read_truncate
+    AFTER TRUNCATE ON content.{table}
+    FOR EACH STATEMENT EXECUTE FUNCTION content.sync_film_work_read();
+    '''
+    for table in TABLES
+)
+
+REVERSE_SQL = '\n'.join(
+    f'''
+    DROP TRIGGER film_work_read_{event} ON content.{table};
+    '''
+    for table in TABLES
+    for event in ('insert', 'update', 'delete', 'truncate')
+) + '''
+DROP FUNCTION content.sync_film_work_read();
+DROP FUNCTION content.refresh_film_work_read(uuid[]);
+DROP TABLE content.film_work_read;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[SQL, TRIGGERS, 'SELECT content.refresh_film_work_read();'],
+            reverse_sql=REVERSE_SQL,
+        ),
+        migrations.CreateModel(
+            name='FilmWorkRead',
+            fields=[
+                ('id', models.UUIDField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=255, verbose_name='title')),
+                ('description', models.TextField(blank=True, null=True, verbose_name='description')),
+                ('creation_date', models.DateField(blank=True, null=True, verbose_name='creation date')),
+                ('rating', models.FloatField(blank=True, null=True, verbose_name='rating')),
+                ('type', models.CharField(choices=[('movie', 'movie'), ('tv_show', 'TV Show')], max_length=20, verbose_name='type')),
+                ('subscription_required', models.BooleanField(default=False)),
+                ('genres', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=255), default=list, size=None)),
+                ('actors', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=255), default=list, size=None)),
+                ('directors', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=255), default=list, size=None)),
+                ('writers', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=255), default=list, size=None)),
+            ],
+            options={
+                'db_table': '"content"."film_work_read"',
+                'managed': False,
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Конфигурация должна совпадать с SEARCH_CONFIG в api.v1.queries, иначе индекс
+# не подойдет для запроса.
+SQL = '''
+ALTER TABLE content.film_work_read ADD COLUMN search_vector tsvector
+GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(title, '')), 'A')
+    || setweight(to_tsvector('english', coalesce(description, '')), 'B')
+) STORED;
+
+CREATE INDEX film_work_read_search_vector_idx
+ON content.film_work_read USING gin (search_vector);
+'''
+
+REVERSE_SQL = '''
+ALTER TABLE content.film_work_read DROP COLUMN search_vector;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0002_film_work_read'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunSQL(
+            sql=SQL,
+            reverse_sql=REVERSE_SQL,
+            state_operations=[
+                migrations.AddField(
+                    model_name='filmworkread',
+                    name='search_vector',
+                    field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='genre',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='genre_name_trgm_idx', opclasses=('gin_trgm_ops',)),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['full_name'], name='person_full_name_trgm_idx', opclasses=('gin_trgm_ops',)),
+        ),
+    ]
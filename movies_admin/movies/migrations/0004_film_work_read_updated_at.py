@@ -0,0 +1,71 @@
+from django.db import migrations, models
+
+# Колонки, которые отдает api. search_vector генерируется из них же.
+COLUMNS = (
+    'title',
+    'description',
+    'creation_date',
+    'rating',
+    'type',
+    'subscription_required',
+    'genres',
+    'actors',
+    'directors',
+    'writers',
+)
+
+# Новые строки, в том числе при пересборке всей таблицы, получают время из
+# DEFAULT. Пересчет фильма переписывает строку, даже если у персоны или
+# жанра поменялось то, чего в api нет, поэтому время обновляется только
+# вместе с колонками COLUMNS.
+SQL = f'''
+ALTER TABLE content.film_work_read
+ADD COLUMN updated_at timestamp with time zone NOT NULL DEFAULT now();
+
+CREATE INDEX film_work_read_updated_at_idx
+ON content.film_work_read (updated_at);
+
+CREATE FUNCTION content.touch_film_work_read() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER film_work_read_updated_at
+BEFORE UPDATE ON content.film_work_read
+FOR EACH ROW
+WHEN (
+    ({', '.join(f'OLD.{column}' for column in COLUMNS)})
+    IS DISTINCT FROM
+    ({', '.join(f'NEW.{column}' for column in COLUMNS)})
+)
+EXECUTE FUNCTION content.touch_film_work_read();
+'''
+
+REVERSE_SQL = '''
+DROP TRIGGER film_work_read_updated_at ON content.film_work_read;
+DROP FUNCTION content.touch_film_work_read();
+ALTER TABLE content.film_work_read DROP COLUMN updated_at;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0003_search'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=SQL,
+            reverse_sql=REVERSE_SQL,
+            state_operations=[
+                migrations.AddField(
+                    model_name='filmworkread',
+                    name='updated_at',
+                    field=models.DateTimeField(editable=False),
+                ),
+            ],
+        ),
+    ]
@@ -1,5 +1,8 @@
 from uuid import uuid4
 
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -28,6 +31,9 @@ class Genre(AbstractTimeStamped, AbstractUUID):
         verbose_name = _('genre')
         verbose_name_plural = _('genres')
         db_table = '"content"."genre"'
+        indexes = [
+            GinIndex(name='genre_name_trgm_idx', fields=('name', ), opclasses=('gin_trgm_ops', ))
+        ]
 
     def __str__(self):
         return self.name
@@ -41,6 +47,9 @@ class Person(AbstractTimeStamped, AbstractUUID):
         verbose_name = _('person')
         verbose_name_plural = _('persons')
         db_table = '"content"."person"'
+        indexes = [
+            GinIndex(name='person_full_name_trgm_idx', fields=('full_name', ), opclasses=('gin_trgm_ops', ))
+        ]
 
     def __str__(self):
         return self.full_name
@@ -108,3 +117,33 @@ class PersonFilmWork(AbstractUUID):
 
     def __str__(self):
         return str(self.pk)
+
+
+class FilmWorkRead(models.Model):
+    """
+    Film with names of its genres and persons for the API. The table is kept
+    in sync with films, genres, persons and their links by triggers, see
+    migration 0002_film_work_read.
+    """
+    id = models.UUIDField(primary_key=True)
+    title = models.CharField(_('title'), max_length=255)
+    description = models.TextField(_('description'), blank=True, null=True)
+    creation_date = models.DateField(_('creation date'), blank=True, null=True)
+    rating = models.FloatField(_('rating'), blank=True, null=True)
+    type = models.CharField(_('type'), max_length=20, choices=FilmWorkType.choices)
+    subscription_required = models.BooleanField(default=False)
+    genres = ArrayField(models.CharField(max_length=255), default=list)
+    actors = ArrayField(models.CharField(max_length=255), default=list)
+    directors = ArrayField(models.CharField(max_length=255), default=list)
+    writers = ArrayField(models.CharField(max_length=255), default=list)
+    # Генерируемая колонка с GIN индексом, см. миграцию 0003_search.
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Время изменения колонок api, см. миграцию 0004_film_work_read_updated_at.
+    updated_at = models.DateTimeField(editable=False)
+
+    class Meta:
+        managed = False
+        db_table = '"content"."film_work_read"'
+
+    def __str__(self):
+        return self.title
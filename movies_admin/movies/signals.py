@@ -0,0 +1,50 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from api.cache import response_cache
+from movies.models import FilmWork, Genre, GenreFilmWork, Person, PersonFilmWork
+
+
+@receiver(post_save, sender=FilmWork)
+@receiver(post_delete, sender=FilmWork)
+def invalidate_film_work(sender, instance: FilmWork, **kwargs):
+    response_cache.invalidate([instance.pk])
+
+
+@receiver(pre_save, sender=GenreFilmWork)
+@receiver(pre_save, sender=PersonFilmWork)
+def remember_film_work(sender, instance, **kwargs):
+    # Связь могут перенести на другой фильм, старый тоже надо сбросить.
+    instance.old_film_work_id = (
+        sender.objects.filter(pk=instance.pk).values_list('film_work_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=GenreFilmWork)
+@receiver(post_save, sender=PersonFilmWork)
+@receiver(post_delete, sender=GenreFilmWork)
+@receiver(post_delete, sender=PersonFilmWork)
+def invalidate_link(sender, instance, **kwargs):
+    response_cache.invalidate({
+        instance.film_work_id, getattr(instance, 'old_film_work_id', None)
+    } - {None})
+
+
+def invalidate_linked_film_works(link_model, **filters):
+    """Films of the genre or the person, lists only if there are any."""
+    film_work_ids = set(
+        link_model.objects.filter(**filters).values_list('film_work_id', flat=True)
+    )
+    response_cache.invalidate(film_work_ids, lists=bool(film_work_ids))
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def invalidate_genre(sender, instance: Genre, **kwargs):
+    invalidate_linked_film_works(GenreFilmWork, genre_id=instance.pk)
+
+
+@receiver(post_save, sender=Person)
+@receiver(post_delete, sender=Person)
+def invalidate_person(sender, instance: Person, **kwargs):
+    invalidate_linked_film_works(PersonFilmWork, person_id=instance.pk)
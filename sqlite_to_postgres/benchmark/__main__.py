@@ -0,0 +1,290 @@
+"""
+Benchmark of MovieETL on generated sqlite dbs.
+
+    python -m benchmark generate --link-rows 1M
+    python -m benchmark run --link-rows 10k,100k,1M --sink null
+
+Run it from the sqlite_to_postgres directory. Every scenario runs in its own
+process, results are appended to benchmark/results.jsonl and compared with the
+previous run of the same parameters.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import typing as t
+from logging import getLogger
+
+import ujson
+
+from benchmark.dataset import DatasetGenerator
+from benchmark.scenario import ScenarioEnum, SinkEnum
+from settings import settings
+
+logger = getLogger("__main__")
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BENCHMARK_DIR, "data")
+RESULTS_FILE = os.path.join(BENCHMARK_DIR, "results.jsonl")
+SIZE_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+# Стадия, которую меряет сценарий: остальные стадии в нем только для полноты.
+STAGE_BY_SCENARIO = {
+    ScenarioEnum.extract: "extract",
+    ScenarioEnum.transform: "transform",
+    ScenarioEnum.load: "load",
+}
+
+
+def parse_size(value: str) -> int:
+    """10k -> 10000, 1M -> 1000000."""
+    value = value.strip().lower()
+    scale = SIZE_SUFFIXES.get(value[-1:], 1)
+    return int(float(value.rstrip("km")) * scale)
+
+
+def get_dataset(link_rows: int, seed: int) -> str:
+    """Path to the db of the size, it is generated once and reused."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, f"links_{link_rows}_seed_{seed}.sqlite")
+
+    if not os.path.exists(path):
+        started_at = time.perf_counter()
+        tmp_path = f"{path}.tmp"
+
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        counts = DatasetGenerator(tmp_path, link_rows, seed).generate()
+        os.replace(tmp_path, path)
+        logger.info(
+            "Generated %s in %.1fs: %s",
+            path,
+            time.perf_counter() - started_at,
+            counts,
+        )
+
+    return path
+
+
+def get_commit() -> t.Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCHMARK_DIR,
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_scenario(
+    scenario: ScenarioEnum,
+    sink: SinkEnum,
+    dataset: str,
+    env: t.Dict[str, str],
+) -> t.Dict[str, t.Any]:
+    """Run the scenario in a child process and reduce its metrics summary."""
+    started_at = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-m", "benchmark.scenario", scenario.value, sink.value],
+        cwd=os.path.dirname(BENCHMARK_DIR),
+        env={**os.environ, **env, "ETL_SOURCE_DB_DSN": dataset},
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    wall_seconds = time.perf_counter() - started_at
+    summary = ujson.loads(process.stdout.strip().splitlines()[-1])
+    stages: t.Dict[str, t.Dict[str, float]] = {}
+
+    for table in summary["tables"].values():
+        for stage, metrics in table["stages"].items():
+            totals = stages.setdefault(stage, {"rows": 0, "busy_seconds": 0.0})
+            totals["rows"] += metrics["rows"]
+            totals["busy_seconds"] = round(
+                totals["busy_seconds"] + metrics["busy_seconds"], 6
+            )
+
+    # Таблицы грузятся параллельно, поэтому пропускная способность стадии
+    # считается по времени всего etl, а не по сумме времени таблиц.
+    for totals in stages.values():
+        totals["rows_per_second"] = (
+            round(totals["rows"] / summary["wall_seconds"])
+            if summary["wall_seconds"]
+            else 0
+        )
+
+    return {
+        "stage": STAGE_BY_SCENARIO[scenario],
+        "etl_wall_seconds": summary["wall_seconds"],
+        "process_wall_seconds": round(wall_seconds, 6),
+        "rows_per_second": stages.get(STAGE_BY_SCENARIO[scenario], {}).get(
+            "rows_per_second", 0
+        ),
+        "peak_rss_bytes": summary["peak_rss_bytes"],
+        "stages": stages,
+        "failed_tables": summary["failed_tables"],
+    }
+
+
+def get_previous(
+    results_file: str, params: t.Dict[str, t.Any]
+) -> t.Optional[t.Dict[str, t.Any]]:
+    """The last stored result with the same parameters."""
+    if not os.path.exists(results_file):
+        return None
+
+    previous = None
+
+    with open(results_file) as file:
+        for line in file:
+            result = ujson.loads(line)
+
+            if result["params"] == params:
+                previous = result
+
+    return previous
+
+
+def compare(
+    result: t.Dict[str, t.Any], previous: t.Dict[str, t.Any], threshold: float
+) -> t.List[str]:
+    """Scenarios that got slower or bigger than the previous run by threshold."""
+    regressions = []
+
+    for scenario, current in result["scenarios"].items():
+        before = previous["scenarios"].get(scenario)
+
+        if not before:
+            continue
+
+        if current["rows_per_second"] < before["rows_per_second"] * (1 - threshold):
+            regressions.append(
+                f"{scenario}: {before['rows_per_second']} -> "
+                f"{current['rows_per_second']} rows/s"
+            )
+
+        current_rss = sum(current["peak_rss_bytes"].values())
+        before_rss = sum(before["peak_rss_bytes"].values())
+
+        if current_rss > before_rss * (1 + threshold):
+            regressions.append(
+                f"{scenario}: {before_rss} -> {current_rss} peak rss bytes"
+            )
+
+    return regressions
+
+
+def run(args: argparse.Namespace) -> int:
+    env = {}
+
+    if args.target_dsn:
+        env["DSN"] = args.target_dsn
+
+    scenarios = [ScenarioEnum(i) for i in args.scenarios.split(",")]
+    has_regressions = False
+
+    for link_rows in [parse_size(i) for i in args.link_rows.split(",")]:
+        dataset = get_dataset(link_rows, args.seed)
+        params = {
+            "link_rows": link_rows,
+            "seed": args.seed,
+            "sink": args.sink,
+            "chunk_size": settings.ETL.CHUNK_SIZE,
+            "adaptive_chunk_size": settings.ETL.ADAPTIVE_CHUNK_SIZE,
+            "fetch_mode": settings.ETL.FETCH_MODE,
+            "load_method": settings.ETL.LOAD_METHOD,
+            "transform_executor": settings.ETL.TRANSFORM_EXECUTOR,
+            "fast_transform": settings.ETL.FAST_TRANSFORM,
+        }
+        result = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": get_commit(),
+            "params": params,
+            "scenarios": {},
+        }
+
+        for scenario in scenarios:
+            result["scenarios"][scenario.value] = run_scenario(
+                scenario, SinkEnum(args.sink), dataset, env
+            )
+            logger.info(
+                "%s link rows, %s: %s rows/s, peak rss %s",
+                link_rows,
+                scenario.value,
+                result["scenarios"][scenario.value]["rows_per_second"],
+                result["scenarios"][scenario.value]["peak_rss_bytes"],
+            )
+
+        previous = get_previous(args.results, params)
+
+        with open(args.results, "a") as file:
+            file.write(ujson.dumps(result) + "\n")
+
+        if not previous:
+            continue
+
+        for regression in compare(result, previous, args.threshold):
+            has_regressions = True
+            logger.warning(
+                "Regression at %s link rows since %s: %s",
+                link_rows,
+                previous["commit"],
+                regression,
+            )
+
+    return int(has_regressions)
+
+
+def generate(args: argparse.Namespace) -> int:
+    for link_rows in [parse_size(i) for i in args.link_rows.split(",")]:
+        logger.info("Dataset: %s", get_dataset(link_rows, args.seed))
+
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmark")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = subparsers.add_parser("generate", help="Generate sqlite dbs")
+    generate_parser.set_defaults(handler=generate)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmark")
+    run_parser.add_argument(
+        "--scenarios", default=",".join(i.value for i in ScenarioEnum)
+    )
+    run_parser.add_argument(
+        "--sink", default=SinkEnum.null.value, choices=[i.value for i in SinkEnum]
+    )
+    run_parser.add_argument(
+        "--target-dsn", help="Postgres for the postgres sink, its tables are truncated"
+    )
+    run_parser.add_argument("--results", default=RESULTS_FILE)
+    run_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Slowdown or memory growth reported as a regression",
+    )
+    run_parser.set_defaults(handler=run)
+
+    for subparser in (generate_parser, run_parser):
+        subparser.add_argument(
+            "--link-rows",
+            default="10k",
+            help="Comma separated sizes from 10k to 10M",
+        )
+        subparser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+import random
+import sqlite3
+import typing as t
+import uuid
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+
+SCHEMA = """
+CREATE TABLE genre (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT,
+    created_at timestamp with time zone,
+    updated_at timestamp with time zone
+);
+CREATE TABLE film_work (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    description TEXT,
+    creation_date DATE,
+    certificate TEXT,
+    file_path TEXT,
+    rating FLOAT,
+    type TEXT not null,
+    created_at timestamp with time zone,
+    updated_at timestamp with time zone,
+    subscription_required boolean default false
+);
+CREATE TABLE person (
+    id TEXT PRIMARY KEY,
+    full_name TEXT NOT NULL,
+    birth_date DATE,
+    created_at timestamp with time zone,
+    updated_at timestamp with time zone
+);
+CREATE TABLE genre_film_work (
+    id TEXT PRIMARY KEY,
+    film_work_id TEXT NOT NULL,
+    genre_id TEXT NOT NULL,
+    created_at timestamp with time zone
+);
+CREATE UNIQUE INDEX film_work_genre ON genre_film_work (film_work_id, genre_id);
+CREATE TABLE person_film_work (
+    id TEXT PRIMARY KEY,
+    film_work_id TEXT NOT NULL,
+    person_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    created_at timestamp with time zone
+);
+CREATE UNIQUE INDEX film_work_person_role
+ON person_film_work (film_work_id, person_id, role);
+"""
+
+GENRES = (
+    "Action", "Adventure", "Animation", "Biography", "Comedy", "Crime",
+    "Documentary", "Drama", "Family", "Fantasy", "Film-Noir", "History",
+    "Horror", "Music", "Musical", "Mystery", "News", "Reality-TV", "Romance",
+    "Sci-Fi", "Short", "Sport", "Talk-Show", "Thriller", "War", "Western",
+)  # fmt: skip
+
+WORDS = (
+    "the", "galaxy", "rebel", "empire", "star", "war", "hope", "return",
+    "force", "dark", "light", "princess", "droid", "captain", "falcon",
+    "freedom", "justice", "hidden", "fortress", "ancient", "planet", "ship",
+    "legend", "journey", "secret", "battle", "last", "new", "lost", "city",
+)  # fmt: skip
+
+# Доли ролей и жанров примерно как в db.sqlite: ~2.2 жанра и ~5.8 персон на фильм.
+GENRES_PER_FILM = (1, 4)
+ACTORS_PER_FILM = (2, 5)
+WRITERS_PER_FILM = (1, 2)
+PERSONS_PER_LINK = 0.5
+BATCH_SIZE = 10_000
+# Нечетный множитель для ключей персон, см. DatasetGenerator.person_id.
+PERSON_KEY_FACTOR = 0x9E3779B97F4A7C15
+
+INSERTS = {
+    "genre": "INSERT INTO genre VALUES (?, ?, ?, ?, ?)",
+    "person": "INSERT INTO person VALUES (?, ?, ?, ?, ?)",
+    "film_work": "INSERT INTO film_work VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+    "genre_film_work": "INSERT INTO genre_film_work VALUES (?, ?, ?, ?)",
+    "person_film_work": "INSERT INTO person_film_work VALUES (?, ?, ?, ?, ?)",
+}
+
+
+class DatasetGenerator:
+    """
+    Generate a sqlite source db with the schema of db.sqlite. The size is set by
+    the number of link rows (genre_film_work + person_film_work), other tables
+    keep the proportions of the real data. The same seed gives the same db.
+    """
+
+    def __init__(self, path: str, link_rows: int, seed: int = 0):
+        self.path = path
+        self.link_rows = link_rows
+        self.random = random.Random(seed)
+        self.started_at = datetime(2021, 6, 16, tzinfo=timezone.utc)
+        self.person_key_base = self.random.getrandbits(64) << 64
+
+    def uuid(self) -> str:
+        return str(uuid.UUID(int=self.random.getrandbits(128), version=4))
+
+    def timestamp(self) -> str:
+        value = self.started_at + timedelta(
+            seconds=self.random.randint(0, 3600 * 24 * 365),
+            microseconds=self.random.randint(0, 999_999),
+        )
+        return value.strftime("%Y-%m-%d %H:%M:%S.%f+00")
+
+    def text(self, min_words: int, max_words: int) -> str:
+        words = self.random.choices(WORDS, k=self.random.randint(min_words, max_words))
+        return " ".join(words).capitalize()
+
+    def person_id(self, index: int) -> str:
+        # Ключ персоны вычисляется по номеру, чтобы не держать ключи всех персон
+        # для связей. Умножение на нечетное число переставляет 62 бита номера,
+        # так что ключи идут не в порядке номеров, а биты версии их не задевают.
+        return str(
+            uuid.UUID(
+                int=self.person_key_base | index * PERSON_KEY_FACTOR % 2**62,
+                version=4,
+            )
+        )
+
+    def generate(self) -> t.Dict[str, int]:
+        """Create the db and return row counts by tables."""
+        connection = sqlite3.connect(self.path)
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.executescript(SCHEMA)
+
+        genres = [
+            (self.uuid(), name, None, self.timestamp(), self.timestamp())
+            for name in GENRES
+        ]
+        persons_count = max(int(self.link_rows * PERSONS_PER_LINK), ACTORS_PER_FILM[1])
+        counts = {table_name: 0 for table_name in INSERTS}
+
+        with connection:
+            counts["genre"] = self.insert_batches(connection, "genre", genres)
+            counts["person"] = self.insert_batches(
+                connection, "person", (self.person(i) for i in range(persons_count))
+            )
+
+        # Фильмы и их связи пишутся пачками по мере генерации, в памяти только
+        # текущая пачка каждой таблицы.
+        batches: t.Dict[str, t.List[t.Tuple]] = {
+            "film_work": [],
+            "genre_film_work": [],
+            "person_film_work": [],
+        }
+
+        with connection:
+            while (
+                counts["genre_film_work"] + counts["person_film_work"] < self.link_rows
+            ):
+                film = self.film()
+                batches["film_work"].append(film)
+
+                for genre in self.random.sample(
+                    genres, self.random.randint(*GENRES_PER_FILM)
+                ):
+                    batches["genre_film_work"].append(
+                        (self.uuid(), film[0], genre[0], film[8])
+                    )
+
+                roles = (
+                    ["director"]
+                    + ["writer"] * self.random.randint(*WRITERS_PER_FILM)
+                    + ["actor"] * self.random.randint(*ACTORS_PER_FILM)
+                )
+
+                for role, person in zip(
+                    roles, self.random.sample(range(persons_count), len(roles))
+                ):
+                    batches["person_film_work"].append(
+                        (self.uuid(), film[0], self.person_id(person), role, film[8])
+                    )
+
+                for table_name, rows in batches.items():
+                    if len(rows) >= BATCH_SIZE:
+                        counts[table_name] += self.insert_batches(
+                            connection, table_name, rows
+                        )
+                        rows.clear()
+
+            for table_name, rows in batches.items():
+                counts[table_name] += self.insert_batches(connection, table_name, rows)
+
+        connection.close()
+
+        return counts
+
+    def person(self, index: int) -> t.Tuple[t.Any, ...]:
+        return (
+            self.person_id(index),
+            self.text(2, 3).title(),
+            None,
+            *(self.timestamp(),) * 2,
+        )
+
+    def film(self) -> t.Tuple[t.Any, ...]:
+        created_at = self.timestamp()
+
+        return (
+            self.uuid(),
+            self.text(1, 6),
+            self.text(20, 120) if self.random.random() < 0.75 else None,
+            None,
+            None,
+            None,
+            round(self.random.uniform(1, 10), 1),
+            "movie",
+            created_at,
+            created_at,
+            0,
+        )
+
+    @staticmethod
+    def insert_batches(
+        connection: sqlite3.Connection, table_name: str, rows: t.Iterable[t.Tuple]
+    ) -> int:
+        """Insert rows of the iterable by BATCH_SIZE and return their count."""
+        rows = iter(rows)
+        count = 0
+
+        while batch := list(islice(rows, BATCH_SIZE)):
+            connection.executemany(INSERTS[table_name], batch)
+            count += len(batch)
+
+        return count
@@ -0,0 +1,175 @@
+"""
+One benchmark scenario in its own process, so the peak memory belongs to the
+scenario only. Settings are read from the env on import, the parent sets
+ETL_SOURCE_DB_DSN to the generated db. The metrics summary is printed as json.
+"""
+
+import asyncio
+import sys
+import typing as t
+from enum import Enum
+
+import ujson
+
+from db_clients import Checkpoint, PostgresDBClient, RejectedRecord, TableNameEnum
+from main import MovieETL
+
+
+class ScenarioEnum(str, Enum):
+    # Извлечение без трансформации и загрузки
+    extract = "extract"
+    # Извлечение и трансформация, загрузка в никуда
+    transform = "transform"
+    # Весь etl, в null sink или в postgres
+    load = "load"
+
+
+class SinkEnum(str, Enum):
+    null = "null"
+    postgres = "postgres"
+
+
+class NullDBClient(PostgresDBClient):
+    """Target that accepts everything and keeps nothing but the rows count."""
+
+    def __init__(self):
+        super().__init__()
+        self.rows = 0
+
+    async def init_db(self):
+        pass
+
+    async def insert_by_copy(self, table_name, data, checkpoint=None) -> None:
+        self.rows += len(data)
+
+    async def insert_by_binary_copy(
+        self, table_name, columns, records, checkpoint=None
+    ) -> None:
+        self.rows += len(records)
+
+    async def upsert_by_copy(self, table_name, columns, records, **kwargs) -> None:
+        self.rows += len(records)
+
+    async def insert_isolating_rejects(
+        self, table_name, columns, records, checkpoint=None, upsert=False
+    ) -> t.List[RejectedRecord]:
+        self.rows += len(records)
+        return []
+
+    async def init_watermarks(self) -> None:
+        pass
+
+    async def get_watermark(self, table_name) -> None:
+        return None
+
+    async def set_watermark(self, table_name, value) -> None:
+        pass
+
+    async def init_checkpoints(self) -> None:
+        pass
+
+    async def get_checkpoints(self, table_name) -> t.List[Checkpoint]:
+        return []
+
+    async def finish_checkpoints(self, table_name) -> None:
+        pass
+
+    async def reset_checkpoints(self) -> None:
+        pass
+
+    async def truncate_tables(self, table_names) -> None:
+        pass
+
+    async def constraint_exists(self, table_name, name) -> bool:
+        return True
+
+    async def validate_constraint(self, table_name, name) -> None:
+        pass
+
+    async def add_foreign_key(
+        self,
+        target_table_name,
+        reference_table_name,
+        fk_name,
+        fk_field,
+        on_delete_cascade=False,
+        not_valid=False,
+    ) -> None:
+        pass
+
+    async def drop_constraint(self, table_name, name) -> None:
+        pass
+
+    async def init_deferred_indexes(self) -> None:
+        pass
+
+    async def defer_indexes(self, table_names) -> None:
+        pass
+
+    async def get_deferred_indexes(self) -> t.List[t.Tuple[str, str]]:
+        return []
+
+    async def build_deferred_index(self, index_name, definition) -> None:
+        pass
+
+    async def refresh_read_model(self) -> bool:
+        return False
+
+
+class BenchmarkETL(MovieETL):
+    def __init__(self, scenario: ScenarioEnum, sink: SinkEnum):
+        super().__init__()
+        self.scenario = scenario
+
+        if sink == SinkEnum.null:
+            self.target_db_client = NullDBClient()
+
+    async def transform(self, table_name, raw_data):
+        if self.scenario == ScenarioEnum.extract:
+            return raw_data
+
+        return await super().transform(table_name, raw_data)
+
+    async def load(self, table_name, transformed_data) -> None:
+        if self.scenario == ScenarioEnum.load:
+            await super().load(table_name, transformed_data)
+
+    async def after_load(self):
+        if self.scenario == ScenarioEnum.load:
+            await super().after_load()
+
+    async def truncate_target(self) -> None:
+        """Empty the target tables, so every run loads the same rows."""
+        await self.target_db_client.truncate_tables(TableNameEnum.all_names())
+        await self.target_db_client.init_checkpoints()
+        await self.target_db_client.reset_checkpoints()
+
+
+async def run_scenario(scenario: ScenarioEnum, sink: SinkEnum) -> t.Dict[str, t.Any]:
+    etl = BenchmarkETL(scenario, sink)
+    await etl.source_db_client.init_db()
+    await etl.target_db_client.init_db()
+
+    try:
+        if sink == SinkEnum.postgres:
+            await etl.truncate_target()
+
+        await etl.run()
+    finally:
+        await etl.source_db_client.close_db()
+
+        if etl.executor:
+            etl.executor.shutdown()
+
+        if etl.target_db_client.db_pool:
+            await etl.target_db_client.db_pool.close()
+
+    summary = etl.metrics.summary()
+    summary["failed_tables"] = sorted(etl.failed_tables)
+
+    return summary
+
+
+if __name__ == "__main__":
+    result = asyncio.run(run_scenario(ScenarioEnum(sys.argv[1]), SinkEnum(sys.argv[2])))
+    print(ujson.dumps(result))
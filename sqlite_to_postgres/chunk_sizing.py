@@ -0,0 +1,102 @@
+import sys
+import typing as t
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+
+class ChunkSizer:
+    """
+    Chunk size of one table that follows the load latency.
+
+    The load of a chunk costs a fixed round trip plus time of every row, so
+    the size is set to load a chunk in about target_seconds with the measured
+    seconds per row. Narrow rows grow to big chunks, wide rows stay small.
+    The size is limited by the memory budget for all chunks of the table in
+    flight, with the measured size of the extracted rows. A sharded table has
+    chunks_in_flight chunks in every pipeline of its shards.
+    """
+
+    # Сглаживание замеров, чтобы один медленный COPY не схлопнул размер пачки
+    SMOOTHING = 0.3
+    MAX_GROWTH = 2.0
+    SAMPLE_ROWS = 32
+
+    def __init__(
+        self,
+        table_name: str,
+        initial_size: int,
+        min_size: int,
+        max_size: int,
+        target_seconds: float,
+        memory_budget: int,
+        chunks_in_flight: int,
+    ):
+        self.table_name = table_name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_seconds = target_seconds
+        self.memory_budget = memory_budget
+        self.chunks_in_flight = max(chunks_in_flight, 1)
+        self.pipelines = 1
+        self.seconds_per_row: t.Optional[float] = None
+        self.bytes_per_row: t.Optional[float] = None
+        self.size = self.clamp(initial_size)
+
+    def __call__(self) -> int:
+        return self.size
+
+    @property
+    def memory_limit(self) -> int:
+        """Max rows in a chunk that keep the table in the memory budget."""
+        if not self.bytes_per_row:
+            return self.max_size
+
+        chunks = self.chunks_in_flight * self.pipelines
+        return int(self.memory_budget / chunks / self.bytes_per_row)
+
+    def clamp(self, size: float) -> int:
+        return int(max(self.min_size, min(size, self.max_size, self.memory_limit)))
+
+    def smooth(self, value: float, previous: t.Optional[float]) -> float:
+        if previous is None:
+            return value
+
+        return previous + self.SMOOTHING * (value - previous)
+
+    @staticmethod
+    def get_row_size(row: t.Sequence[t.Any]) -> int:
+        return sys.getsizeof(row) + sum(sys.getsizeof(i) for i in row)
+
+    def observe_rows(self, rows: t.Sequence[t.Sequence[t.Any]]) -> None:
+        """Measure bytes per row on a sample of the extracted chunk."""
+        sample = rows[: self.SAMPLE_ROWS]
+
+        if not sample:
+            return
+
+        bytes_per_row = sum(self.get_row_size(i) for i in sample) / len(sample)
+        self.bytes_per_row = self.smooth(bytes_per_row, self.bytes_per_row)
+        self.resize(self.size)
+
+    def observe_load(self, rows: int, seconds: float) -> None:
+        """Resize by the latency of the loaded chunk."""
+        if not rows or seconds <= 0:
+            return
+
+        self.seconds_per_row = self.smooth(seconds / rows, self.seconds_per_row)
+        self.resize(
+            min(
+                self.target_seconds / self.seconds_per_row,
+                self.size * self.MAX_GROWTH,
+            )
+        )
+
+    def resize(self, size: float) -> None:
+        size = self.clamp(size)
+
+        if size != self.size:
+            logger.debug(
+                "Chunk size of %s table: %s -> %s", self.table_name, self.size, size
+            )
+            self.size = size
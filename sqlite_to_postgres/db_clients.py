@@ -1,4 +1,3 @@
-import io
 import typing as t
 from enum import Enum
 
@@ -26,6 +25,17 @@ class BaseEnum(Enum):
         return [i.name for i in cls]
 
 
+class FetchModeEnum(str, BaseEnum):
+    offset = "offset"
+    keyset = "keyset"
+    stream = "stream"
+
+
+class LoadMethodEnum(str, BaseEnum):
+    text = "text"
+    binary = "binary"
+
+
 class TableNameEnum(str, BaseEnum):
     film_work = "film_work"
     genre_film_work = "genre_film_work"
@@ -50,16 +60,68 @@ class TableFKFieldsEnum(str, Enum):
         return f"fk_{target_filed}"
 
 
+# Уникальные ключи таблиц связей помимо id, см. schema_design/init.sql.
+NATURAL_KEYS: t.Dict[str, t.Tuple[str, ...]] = {
+    TableNameWithFKEnum.genre_film_work.value: (
+        TableFKFieldsEnum.film_work_id.value,
+        TableFKFieldsEnum.genre_id.value,
+    ),
+    TableNameWithFKEnum.person_film_work.value: (
+        TableFKFieldsEnum.film_work_id.value,
+        TableFKFieldsEnum.person_id.value,
+        "role",
+    ),
+}
+
+
+class Condition(t.NamedTuple):
+    """Sql where clause with its positional params."""
+
+    clause: str
+    params: t.Tuple[t.Any, ...] = ()
+
+    @classmethod
+    def join(cls, *conditions: t.Optional["Condition"]) -> t.Optional["Condition"]:
+        """Join conditions with AND, empty ones are skipped."""
+        conditions = [i for i in conditions if i]
+
+        if not conditions:
+            return None
+
+        return cls(
+            " AND ".join(f"({i.clause})" for i in conditions),
+            tuple(param for i in conditions for param in i.params),
+        )
+
+
+class Checkpoint(t.NamedTuple):
+    """Chunk of a table that has been loaded to the target db."""
+
+    table_name: str
+    first_key: str
+    last_key: str
+    rows_count: int
+    checksum: str
+    finished: bool = False
+
+
+class RejectedRecord(t.NamedTuple):
+    record: t.Tuple[t.Any, ...]
+    error: str
+
+
 class SQLiteDBClient:
     ROWS_LIMIT = settings.ETL.CHUNK_SIZE
     DB_NAME = settings.ETL.SOURCE_DB_DSN
+    KEY_FIELD = "id"
 
-    def __init__(self):
+    def __init__(self, db_name: t.Optional[str] = None):
+        self.db_name = db_name or SQLiteDBClient.DB_NAME
         self.database: t.Optional[aiosqlite.Connection] = None
 
     async def init_db(self) -> None:
         try:
-            self.database = await aiosqlite.connect(SQLiteDBClient.DB_NAME)
+            self.database = await aiosqlite.connect(self.db_name)
         except Exception as err:
             raise DBError from err
 
@@ -71,15 +133,18 @@ class SQLiteDBClient:
         offset: int,
         fields: t.Tuple[str] = None,
         mapping_schema: BaseModel = None,
+        condition: t.Optional[Condition] = None,
+        limit: t.Optional[int] = None,
     ) -> t.Union[t.Iterable[Row], t.List[BaseModel]]:
         """
         Fetch data from db with pagination. Pass a queryset row mapper
         if you need to convert queryset.
         """
         fields = ", ".join(fields) if fields else "*"
+        where, params = self.get_where(condition)
         query = (
-            f"SELECT {fields} FROM {table_name} limit $1 offset $2",
-            (self.ROWS_LIMIT, offset),
+            f"SELECT {fields} FROM {table_name} {where} limit ? offset ?",
+            (*params, limit or self.ROWS_LIMIT, offset),
         )
 
         # Спасибо за коммент про курсор, учту на будущее, но в текущей реализации
@@ -96,35 +161,224 @@ class SQLiteDBClient:
         except Exception as err:
             raise DBError from err
 
+    @staticmethod
+    def get_where(
+        condition: t.Optional[Condition], *conditions: Condition
+    ) -> t.Tuple[str, t.Tuple[t.Any, ...]]:
+        """Join conditions to a where clause with its params."""
+        condition = Condition.join(condition, *conditions)
+
+        if not condition:
+            return "", ()
+
+        return f"WHERE {condition.clause}", condition.params
+
     @staticmethod
     def by_pydantic(queryset: t.Iterable[Row], schema: BaseModel) -> t.List[BaseModel]:
         """Convert all rows in queryset with pydantic schema."""
         return [schema(**dict(row)) for row in queryset]
 
+    async def fetch_page_by_key(
+        self,
+        table_name: str,
+        last_key: t.Optional[str],
+        fields: t.Tuple[str] = None,
+        condition: t.Optional[Condition] = None,
+        limit: t.Optional[int] = None,
+    ) -> t.List[Row]:
+        """
+        Fetch the page that follows last_key. Rows are ordered by the primary key,
+        so sqlite seeks into the pk index instead of skipping offset rows.
+        """
+        fields = ", ".join(fields) if fields else "*"
+        where, params = self.get_where(
+            Condition(f"{self.KEY_FIELD} > ?", (last_key or "",)), condition
+        )
+        query = (
+            f"SELECT {fields} FROM {table_name} {where} "
+            f"ORDER BY {self.KEY_FIELD} limit ?",
+            (*params, limit or self.ROWS_LIMIT),
+        )
+
+        try:
+            async with self.database.execute_fetchall(*query) as queryset:
+                return list(queryset)
+        except Exception as err:
+            raise DBError from err
+
     async def fetch(
         self,
         table_name: str,
         fields: t.Tuple[str] = None,
         mapping_schema: t.Callable = None,
+        mode: FetchModeEnum = FetchModeEnum.offset,
+        condition: t.Optional[Condition] = None,
+        rows_limit: t.Optional[t.Callable[[], int]] = None,
     ) -> t.AsyncGenerator[t.List[t.Dict[str, t.Any]], None]:
-        """Fetch data by chunks with settings.ETL.CHUNK_SIZE"""
+        """
+        Fetch data by chunks with settings.ETL.CHUNK_SIZE. rows_limit is called
+        before every chunk and can change the size of the next one.
+        """
+        rows_limit = rows_limit or (lambda: self.ROWS_LIMIT)
+
+        if mode == FetchModeEnum.keyset:
+            chunks = self._fetch_by_key(table_name, fields, condition, rows_limit)
+        elif mode == FetchModeEnum.stream:
+            chunks = self._fetch_by_cursor(table_name, fields, condition, rows_limit)
+        else:
+            chunks = self._fetch_by_offset(table_name, fields, condition, rows_limit)
+
+        async for chunk in chunks:
+            if mapping_schema:
+                chunk = self.by_pydantic(chunk, mapping_schema)
+
+            yield chunk
+
+    async def _fetch_by_offset(
+        self,
+        table_name: str,
+        fields: t.Tuple[str] = None,
+        condition: t.Optional[Condition] = None,
+        rows_limit: t.Callable[[], int] = None,
+    ) -> t.AsyncGenerator[t.Iterable[Row], None]:
         offset = 0
 
         while True:
-            result = await self.fetch_page(table_name, offset, fields, mapping_schema)
+            result = await self.fetch_page(
+                table_name, offset, fields, condition=condition, limit=rows_limit()
+            )
+
+            if not result:
+                break
+
+            yield result
+
+            offset += len(result)
+
+    async def _fetch_by_key(
+        self,
+        table_name: str,
+        fields: t.Tuple[str] = None,
+        condition: t.Optional[Condition] = None,
+        rows_limit: t.Callable[[], int] = None,
+    ) -> t.AsyncGenerator[t.List[Row], None]:
+        if fields and self.KEY_FIELD not in fields:
+            fields = (self.KEY_FIELD, *fields)
+
+        last_key = None
+
+        while True:
+            result = await self.fetch_page_by_key(
+                table_name, last_key, fields, condition, rows_limit()
+            )
 
             if not result:
                 break
 
             yield result
 
-            offset += self.ROWS_LIMIT
+            last_key = result[-1][self.KEY_FIELD]
+
+    async def _fetch_by_cursor(
+        self,
+        table_name: str,
+        fields: t.Tuple[str] = None,
+        condition: t.Optional[Condition] = None,
+        rows_limit: t.Callable[[], int] = None,
+    ) -> t.AsyncGenerator[t.List[Row], None]:
+        """Iterate one open statement, taking rows_limit() rows at a time."""
+        fields = ", ".join(fields) if fields else "*"
+        where, params = self.get_where(condition)
+        query = f"SELECT {fields} FROM {table_name} {where}"
+
+        try:
+            async with self.database.execute(query, params) as cursor:
+                while True:
+                    result = await cursor.fetchmany(rows_limit())
+
+                    if not result:
+                        break
+
+                    yield result
+        except Exception as err:
+            raise DBError from err
+
+    async def fetch_max(
+        self, table_name: str, field: str, condition: t.Optional[Condition] = None
+    ) -> t.Any:
+        """Fetch max value of the field."""
+        where, params = self.get_where(condition)
+        query = f"SELECT max({field}) FROM {table_name} {where}"
+
+        try:
+            async with self.database.execute(query, params) as cursor:
+                row = await cursor.fetchone()
+        except Exception as err:
+            raise DBError from err
+
+        return row[0]
+
+    async def fetch_count(
+        self, table_name: str, condition: t.Optional[Condition] = None
+    ) -> int:
+        """Fetch count of rows."""
+        where, params = self.get_where(condition)
+        query = f"SELECT count(*) FROM {table_name} {where}"
+
+        try:
+            async with self.database.execute(query, params) as cursor:
+                row = await cursor.fetchone()
+        except Exception as err:
+            raise DBError from err
+
+        return row[0]
+
+    async def fetch_shard_bounds(
+        self, table_name: str, shards: int, condition: t.Optional[Condition] = None
+    ) -> t.List[str]:
+        """
+        Fetch primary keys that split rows of the table to shards of equal size.
+        Returns shards - 1 keys, every key is the last key of its shard.
+        """
+        count = await self.fetch_count(table_name, condition)
+        where, params = self.get_where(condition)
+        query = (
+            f"SELECT {self.KEY_FIELD} FROM {table_name} {where} "
+            f"ORDER BY {self.KEY_FIELD} limit 1 offset ?"
+        )
+        bounds = []
+
+        try:
+            for shard in range(1, shards):
+                offset = max(count * shard // shards - 1, 0)
+
+                async with self.database.execute(query, (*params, offset)) as cursor:
+                    row = await cursor.fetchone()
+
+                if row and (not bounds or bounds[-1] < row[0]):
+                    bounds.append(row[0])
+        except Exception as err:
+            raise DBError from err
+
+        return bounds
 
     async def close_db(self):
         await self.database.close()
 
 
 class PostgresDBClient:
+    # Ошибки из-за данных строки, а не из-за соединения или схемы. ValueError
+    # бросает asyncpg, когда не может закодировать значение для binary COPY.
+    REJECTABLE_ERRORS = (
+        asyncpg.DataError,
+        asyncpg.IntegrityConstraintViolationError,
+        ValueError,
+    )
+
+    COPY_BUFFER_ROWS = 1000
+    # Параметр сессии, который выключает триггеры read model api (content.film_work_read).
+    READ_MODEL_SYNC = "content.film_work_read_sync"
+
     class Decorators:
         @classmethod
         def db_session(cls, decorated: t.Callable):
@@ -150,12 +404,13 @@ class PostgresDBClient:
         # но кажется, что лучше эту логику описать в клиенте к бд.
         self.null_value = null_value or "None"
 
-    async def init_db(self):
-        """Initialize db connection pool."""
+    async def init_db(self, server_settings: t.Optional[t.Dict[str, str]] = None):
+        """Initialize db connection pool, server_settings are set on connect."""
         self.db_pool = await asyncpg.create_pool(
             dsn=settings.ETL.TARGET_DB.DSN,
             min_size=settings.ETL.TARGET_DB.MIN_POOL_SIZE,
             max_size=settings.ETL.TARGET_DB.MAX_POOL_SIZE,
+            server_settings=server_settings,
         )
 
     @Decorators.db_session
@@ -163,31 +418,468 @@ class PostgresDBClient:
         self,
         table_name: TableNameEnum,
         data: t.List[t.Dict[str, t.Any]],
+        checkpoint: t.Optional[Checkpoint] = None,
         db_pool: asyncpg.pool.Pool = None,
     ) -> None:
-        """Insert data to db with COPY statement."""
+        """
+        Insert data to db with COPY statement. The checkpoint is saved in the same
+        transaction.
+        """
         if not data:
             return
 
-        columns = data[0].keys()
-        values = [i.values() for i in data]
+        columns = list(data[0].keys())
+
+        async def source() -> t.AsyncIterator[bytes]:
+            # Пачка кодируется частями, а не одной строкой и ее копией в BytesIO.
+            for offset in range(0, len(data), self.COPY_BUFFER_ROWS):
+                yield "".join(
+                    self.delimiter.join([str(i) for i in row.values()]) + "\n"
+                    for row in data[offset : offset + self.COPY_BUFFER_ROWS]
+                ).encode()
+
+        try:
+            async with db_pool.transaction():
+                await db_pool.copy_to_table(
+                    table_name,
+                    source=source(),
+                    schema_name=settings.ETL.TARGET_DB.SCHEMA,
+                    columns=columns,
+                    delimiter=self.delimiter,
+                    null=self.null_value,
+                )
+
+                if checkpoint:
+                    await self._save_checkpoint(db_pool, checkpoint)
+        except Exception as err:
+            raise DBError from err
+
+    @Decorators.db_session
+    async def insert_by_binary_copy(
+        self,
+        table_name: TableNameEnum,
+        columns: t.Sequence[str],
+        records: t.Iterable[t.Tuple[t.Any, ...]],
+        checkpoint: t.Optional[Checkpoint] = None,
+        db_pool: asyncpg.pool.Pool = None,
+    ) -> None:
+        """
+        Insert records to db with binary COPY. Records are tuples of python
+        values in the columns order, asyncpg encodes them with the column types
+        of the target table. The checkpoint is saved in the same transaction,
+        it is saved even without records.
+        """
+        if not records and not checkpoint:
+            return
+
+        try:
+            async with db_pool.transaction():
+                if records:
+                    await db_pool.copy_records_to_table(
+                        table_name,
+                        records=records,
+                        columns=columns,
+                        schema_name=settings.ETL.TARGET_DB.SCHEMA,
+                    )
+
+                if checkpoint:
+                    await self._save_checkpoint(db_pool, checkpoint)
+        except Exception as err:
+            raise DBError from err
+
+    @Decorators.db_session
+    async def upsert_by_copy(
+        self,
+        table_name: TableNameEnum,
+        columns: t.Sequence[str],
+        records: t.Iterable[t.Tuple[t.Any, ...]],
+        db_pool: asyncpg.pool.Pool = None,
+    ) -> None:
+        """
+        Insert or update records. Records are copied to a staging table and then
+        merged to the target table with INSERT ... ON CONFLICT DO UPDATE, by id
+        or, for link tables, by their NATURAL_KEYS.
+        """
+        if not records:
+            return
+
+        try:
+            async with db_pool.transaction():
+                await self._upsert_records(db_pool, table_name, columns, records)
+        except Exception as err:
+            raise DBError from err
 
-        data_string = "\n".join(
-            self.delimiter.join([str(i) for i in v]) for v in values
+    @staticmethod
+    async def _upsert_records(
+        connection: asyncpg.Connection,
+        table_name: TableNameEnum,
+        columns: t.Sequence[str],
+        records: t.Iterable[t.Tuple[t.Any, ...]],
+    ) -> None:
+        # Временная таблица не пишется в WAL так же, как unlogged, но живет в
+        # рамках соединения, поэтому параллельные загрузки одной и той же таблицы
+        # не мешают друг другу. ON COMMIT DELETE ROWS чистит ее после каждой пачки.
+        staging_table = f"{table_name}_staging"
+        target_table = f"{settings.ETL.TARGET_DB.SCHEMA}.{table_name}"
+        fields = ", ".join(columns)
+        conflict_fields = NATURAL_KEYS.get(table_name, (TableFKFieldsEnum.id.value,))
+        conflict_target = ", ".join(conflict_fields)
+        updates = ", ".join(
+            f"{i} = EXCLUDED.{i}" for i in columns if i not in conflict_fields
+        )
+
+        await connection.execute(f"""
+            CREATE TEMP TABLE IF NOT EXISTS {staging_table}
+            (LIKE {target_table} INCLUDING DEFAULTS)
+            ON COMMIT DELETE ROWS
+            """)
+        await connection.copy_records_to_table(
+            staging_table, records=records, columns=columns
+        )
+
+        if table_name in NATURAL_KEYS:
+            # Пара фильма и жанра (персоны и роли) может прийти с новым id, такие
+            # строки сливаются по ней. Строка с прежним id и другой парой
+            # заменяет старую, как при слиянии по id.
+            target_key = ", ".join(f"target.{i}" for i in conflict_fields)
+            staging_key = ", ".join(f"staging.{i}" for i in conflict_fields)
+            await connection.execute(f"""
+                DELETE FROM {target_table} AS target
+                USING {staging_table} AS staging
+                WHERE target.id = staging.id
+                AND ({target_key}) IS DISTINCT FROM ({staging_key})
+                """)
+
+        await connection.execute(f"""
+            INSERT INTO {target_table} ({fields})
+            SELECT {fields} FROM {staging_table}
+            ON CONFLICT ({conflict_target}) DO UPDATE SET {updates}
+            """)
+        # Несколько частей одной транзакции не должны сливать строки друг друга.
+        await connection.execute(f"DELETE FROM {staging_table}")
+
+    @Decorators.db_session
+    async def insert_isolating_rejects(
+        self,
+        table_name: TableNameEnum,
+        columns: t.Sequence[str],
+        records: t.Sequence[t.Tuple[t.Any, ...]],
+        checkpoint: t.Optional[Checkpoint] = None,
+        upsert: bool = False,
+        db_pool: asyncpg.pool.Pool = None,
+    ) -> t.List[RejectedRecord]:
+        """
+        Load records of a chunk that failed as a whole. The chunk is split in
+        halves recursively, every part is copied inside its own savepoint, so
+        a failed part is rolled back alone. Rows that fail one by one are
+        returned with their errors, the rest and the checkpoint are committed
+        in one transaction. Records are loaded by binary COPY or by upsert.
+        """
+        rejected: t.List[RejectedRecord] = []
+
+        try:
+            async with db_pool.transaction():
+                await self._bisect(
+                    db_pool, table_name, columns, list(records), upsert, rejected
+                )
+
+                if checkpoint:
+                    await self._save_checkpoint(db_pool, checkpoint)
+        except Exception as err:
+            raise DBError from err
+
+        return rejected
+
+    async def _bisect(
+        self,
+        connection: asyncpg.Connection,
+        table_name: TableNameEnum,
+        columns: t.Sequence[str],
+        records: t.List[t.Tuple[t.Any, ...]],
+        upsert: bool,
+        rejected: t.List[RejectedRecord],
+        failed: bool = True,
+    ) -> None:
+        if not failed:
+            try:
+                async with connection.transaction():
+                    if upsert:
+                        await self._upsert_records(
+                            connection, table_name, columns, records
+                        )
+                    else:
+                        await connection.copy_records_to_table(
+                            table_name,
+                            records=records,
+                            columns=columns,
+                            schema_name=settings.ETL.TARGET_DB.SCHEMA,
+                        )
+
+                return
+            except self.REJECTABLE_ERRORS as err:
+                if len(records) == 1:
+                    rejected.append(
+                        RejectedRecord(records[0], f"{type(err).__name__}: {err}")
+                    )
+                    return
+
+        middle = len(records) // 2
+
+        for part in (records[:middle], records[middle:]):
+            if part:
+                await self._bisect(
+                    connection, table_name, columns, part, upsert, rejected, False
+                )
+
+    @Decorators.db_session
+    async def init_watermarks(self, db_pool: asyncpg.pool.Pool = None) -> None:
+        """Create the table with per-table watermarks of the incremental etl."""
+        query = f"""
+        CREATE TABLE IF NOT EXISTS
+        {settings.ETL.TARGET_DB.SCHEMA}.{settings.ETL.TARGET_DB.WATERMARK_TABLE} (
+            table_name TEXT PRIMARY KEY,
+            watermark TEXT NOT NULL,
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
         )
+        """
+
+        try:
+            await db_pool.execute(query)
+        except Exception as err:
+            raise DBError from err
 
-        data = io.BytesIO()
-        data.write(data_string.encode())
-        data.seek(0)
+    @Decorators.db_session
+    async def get_watermark(
+        self, table_name: TableNameEnum, db_pool: asyncpg.pool.Pool = None
+    ) -> t.Optional[str]:
+        """Get the last loaded watermark of the table."""
+        query = f"""
+        SELECT watermark
+        FROM {settings.ETL.TARGET_DB.SCHEMA}.{settings.ETL.TARGET_DB.WATERMARK_TABLE}
+        WHERE table_name = $1
+        """
 
         try:
-            await db_pool.copy_to_table(
-                table_name,
-                source=data,
-                schema_name=settings.ETL.TARGET_DB.SCHEMA,
-                columns=columns,
-                delimiter=self.delimiter,
-                null=self.null_value,
+            return await db_pool.fetchval(query, table_name)
+        except Exception as err:
+            raise DBError from err
+
+    @Decorators.db_session
+    async def set_watermark(
+        self,
+        table_name: TableNameEnum,
+        watermark: str,
+        db_pool: asyncpg.pool.Pool = None,
+    ) -> None:
+        """Save the watermark of the table."""
+        query = f"""
+        INSERT INTO
+        {settings.ETL.TARGET_DB.SCHEMA}.{settings.ETL.TARGET_DB.WATERMARK_TABLE}
+        (table_name, watermark) VALUES ($1, $2)
+        ON CONFLICT (table_name) DO UPDATE
+        SET watermark = EXCLUDED.watermark, updated_at = CURRENT_TIMESTAMP
+        """
+
+        try:
+            await db_pool.execute(query, table_name, watermark)
+        except Exception as err:
+            raise DBError from err
+
+    @Decorators.db_session
+    async def init_checkpoints(self, db_pool: asyncpg.pool.Pool = None) -> None:
+        """Create the table with loaded chunks of the resumable etl."""
+        query = f"""
+        CREATE TABLE IF NOT EXISTS
+        {settings.ETL.TARGET_DB.SCHEMA}.{settings.ETL.TARGET_DB.CHECKPOINT_TABLE} (
+            table_name TEXT NOT NULL,
+            first_key TEXT NOT NULL,
+            last_key TEXT NOT NULL,
+            rows_count BIGINT NOT NULL,
+            checksum TEXT NOT NULL,
+            finished BOOLEAN NOT NULL DEFAULT FALSE,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (table_name, first_key)
+        )
+        """
+
+        try:
+            await db_pool.execute(query)
+        except Exception as err:
+            raise DBError from err
+
+    @staticmethod
+    async def _save_checkpoint(
+        connection: asyncpg.Connection, checkpoint: Checkpoint
+    ) -> None:
+        query = f"""
+        INSERT INTO
+        {settings.ETL.TARGET_DB.SCHEMA}.{settings.ETL.TARGET_DB.CHECKPOINT_TABLE}
+        (table_name, first_key, last_key, rows_count, checksum, finished)
+        VALUES ($1, $2, $3, $4, $5, $6)
+        """
+
+        await connection.execute(query, *checkpoint)
+
+    @Decorators.db_session
+    async def get_checkpoints(
+        self, table_name: TableNameEnum, db_pool: asyncpg.pool.Pool = None
+    ) -> t.List[Checkpoint]:
+        """Get loaded chunks of the table ordered by keys."""
+        query = f"""
+        SELECT table_name, first_key, last_key, rows_count, checksum, finished
+        FROM {settings.ETL.TARGET_DB.SCHEMA}.{settings.ETL.TARGET_DB.CHECKPOINT_TABLE}
+        WHERE table_name = $1
+        ORDER BY first_key
+        """
+
+        try:
+            return [Checkpoint(*i) for i in await db_pool.fetch(query, table_name)]
+        except Exception as err:
+            raise DBError from err
+
+    @Decorators.db_session
+    async def finish_checkpoints(
+        self, table_name: TableNameEnum, db_pool: asyncpg.pool.Pool = None
+    ) -> None:
+        """Collapse loaded chunks of the table to one finished checkpoint."""
+        table = (
+            f"{settings.ETL.TARGET_DB.SCHEMA}.{settings.ETL.TARGET_DB.CHECKPOINT_TABLE}"
+        )
+        query = f"""
+        SELECT
+            coalesce(min(first_key), ''),
+            coalesce(max(last_key), ''),
+            coalesce(sum(rows_count), 0),
+            md5(coalesce(string_agg(checksum, '' ORDER BY first_key), ''))
+        FROM {table}
+        WHERE table_name = $1
+        """
+
+        try:
+            async with db_pool.transaction():
+                first_key, last_key, rows_count, checksum = await db_pool.fetchrow(
+                    query, table_name
+                )
+                await db_pool.execute(
+                    f"DELETE FROM {table} WHERE table_name = $1", table_name
+                )
+                await self._save_checkpoint(
+                    db_pool,
+                    Checkpoint(
+                        table_name, first_key, last_key, rows_count, checksum, True
+                    ),
+                )
+        except Exception as err:
+            raise DBError from err
+
+    @Decorators.db_session
+    async def reset_checkpoints(self, db_pool: asyncpg.pool.Pool = None) -> None:
+        """Forget all loaded chunks."""
+        query = f"""
+        DELETE FROM
+        {settings.ETL.TARGET_DB.SCHEMA}.{settings.ETL.TARGET_DB.CHECKPOINT_TABLE}
+        """
+
+        try:
+            await db_pool.execute(query)
+        except Exception as err:
+            raise DBError from err
+
+    @Decorators.db_session
+    async def truncate_tables(
+        self, table_names: t.Iterable[str], db_pool: asyncpg.pool.Pool = None
+    ) -> None:
+        """Empty the tables of the target schema."""
+        tables = ", ".join(f"{settings.ETL.TARGET_DB.SCHEMA}.{i}" for i in table_names)
+
+        try:
+            await db_pool.execute(f"TRUNCATE {tables} CASCADE")
+        except Exception as err:
+            raise DBError from err
+
+    @staticmethod
+    def get_key_range(
+        lower: t.Optional[str], upper: t.Optional[str]
+    ) -> t.Tuple[str, t.Tuple[str, ...]]:
+        """Where clause of the key range, lower is included and upper is not."""
+        clauses, params = [], []
+
+        for bound, operator in ((lower, ">="), (upper, "<")):
+            if bound is not None:
+                params.append(bound)
+                clauses.append(f"id {operator} ${len(params)}::uuid")
+
+        return " AND ".join(clauses) or "TRUE", tuple(params)
+
+    @Decorators.db_session
+    async def fetch_range_hash(
+        self,
+        table_name: TableNameEnum,
+        row_hash: str,
+        lower: t.Optional[str] = None,
+        upper: t.Optional[str] = None,
+        db_pool: asyncpg.pool.Pool = None,
+    ) -> t.Tuple[int, int]:
+        """
+        Count and sum of the row_hash sql expression over the key range. The sum
+        doesn't depend on the order of rows, so it is computed by postgres.
+        """
+        where, params = self.get_key_range(lower, upper)
+        query = f"""
+        SELECT count(*), coalesce(sum({row_hash}), 0)
+        FROM {settings.ETL.TARGET_DB.SCHEMA}.{table_name}
+        WHERE {where}
+        """
+
+        try:
+            count, hash_sum = await db_pool.fetchrow(query, *params)
+        except Exception as err:
+            raise DBError from err
+
+        return count, int(hash_sum)
+
+    @Decorators.db_session
+    async def fetch_row_hashes(
+        self,
+        table_name: TableNameEnum,
+        row_hash: str,
+        lower: t.Optional[str] = None,
+        upper: t.Optional[str] = None,
+        db_pool: asyncpg.pool.Pool = None,
+    ) -> t.Dict[str, int]:
+        """Value of the row_hash sql expression by keys of the key range."""
+        where, params = self.get_key_range(lower, upper)
+        query = f"""
+        SELECT id::text, {row_hash}
+        FROM {settings.ETL.TARGET_DB.SCHEMA}.{table_name}
+        WHERE {where}
+        """
+
+        try:
+            return dict(await db_pool.fetch(query, *params))
+        except Exception as err:
+            raise DBError from err
+
+    @Decorators.db_session
+    async def constraint_exists(
+        self,
+        table_name: TableNameEnum,
+        constraint_name: str,
+        db_pool: asyncpg.pool.Pool = None,
+    ) -> bool:
+        """Check if the table already has the constraint."""
+        query = """
+        SELECT EXISTS (
+            SELECT 1 FROM pg_constraint
+            WHERE conname = $1 AND conrelid = $2::regclass
+        )
+        """
+
+        try:
+            return await db_pool.fetchval(
+                query,
+                constraint_name,
+                f"{settings.ETL.TARGET_DB.SCHEMA}.{table_name}",
             )
         except Exception as err:
             raise DBError from err
@@ -201,8 +893,12 @@ class PostgresDBClient:
         fk_field: TableFKFieldsEnum,
         db_pool: asyncpg.pool.Pool = None,
         on_delete_cascade: bool = False,
+        not_valid: bool = False,
     ) -> None:
-        """Add foreign key to target table."""
+        """
+        Add foreign key to target table. A NOT VALID key doesn't check existing
+        rows, call validate_constraint for it later.
+        """
 
         # Если задать форен кеи до вставки данных в бд, то мы поймаем ошибку,
         # связанную с тем, что в поле с форен кеем лежит айди, которого
@@ -217,9 +913,165 @@ class PostgresDBClient:
         """
 
         if on_delete_cascade:
-            query += "ON DELETE CASCADE"
+            query += "ON DELETE CASCADE "
+
+        if not_valid:
+            query += "NOT VALID"
+
+        try:
+            await db_pool.execute(query)
+        except Exception as err:
+            raise DBError from err
+
+    @Decorators.db_session
+    async def drop_constraint(
+        self,
+        table_name: TableNameEnum,
+        constraint_name: str,
+        db_pool: asyncpg.pool.Pool = None,
+    ) -> None:
+        """Drop the constraint of the table if it exists."""
+        query = f"""
+        ALTER TABLE {settings.ETL.TARGET_DB.SCHEMA}.{table_name}
+        DROP CONSTRAINT IF EXISTS {constraint_name}
+        """
+
+        try:
+            await db_pool.execute(query)
+        except Exception as err:
+            raise DBError from err
+
+    @Decorators.db_session
+    async def validate_constraint(
+        self,
+        table_name: TableNameEnum,
+        constraint_name: str,
+        db_pool: asyncpg.pool.Pool = None,
+    ) -> None:
+        """
+        Check existing rows against a NOT VALID constraint. Unlike ADD CONSTRAINT
+        it doesn't block writes to the table while scanning.
+        """
+        query = f"""
+        ALTER TABLE {settings.ETL.TARGET_DB.SCHEMA}.{table_name}
+        VALIDATE CONSTRAINT {constraint_name}
+        """
+
+        try:
+            await db_pool.execute(query)
+        except Exception as err:
+            raise DBError from err
+
+    @Decorators.db_session
+    async def refresh_read_model(self, db_pool: asyncpg.pool.Pool = None) -> bool:
+        """
+        Rebuild the read model of the api from scratch. False if the db
+        doesn't have it, i.e. migrations of movies_admin are not applied.
+        """
+        function = f"{settings.ETL.TARGET_DB.SCHEMA}.refresh_film_work_read"
+
+        try:
+            if not await db_pool.fetchval("SELECT to_regproc($1)", function):
+                return False
+
+            await db_pool.execute(f"SELECT {function}()")
+        except Exception as err:
+            raise DBError from err
+
+        return True
+
+    @Decorators.db_session
+    async def init_deferred_indexes(self, db_pool: asyncpg.pool.Pool = None) -> None:
+        """Create the table with definitions of indexes dropped for bulk load."""
+        query = f"""
+        CREATE TABLE IF NOT EXISTS
+        {settings.ETL.TARGET_DB.SCHEMA}.{settings.ETL.TARGET_DB.DEFERRED_INDEX_TABLE} (
+            index_name TEXT PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            definition TEXT NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )
+        """
 
         try:
             await db_pool.execute(query)
         except Exception as err:
             raise DBError from err
+
+    @Decorators.db_session
+    async def defer_indexes(
+        self, table_names: t.List[TableNameEnum], db_pool: asyncpg.pool.Pool = None
+    ) -> None:
+        """
+        Drop secondary indexes of the tables. Primary keys and indexes of
+        constraints are kept. Definitions are saved in the same transaction,
+        so a crashed load doesn't lose them.
+        """
+        schema = settings.ETL.TARGET_DB.SCHEMA
+        query = """
+        SELECT index_class.relname, table_class.relname,
+               pg_get_indexdef(index_class.oid)
+        FROM pg_index
+        JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid
+        JOIN pg_class table_class ON table_class.oid = pg_index.indrelid
+        JOIN pg_namespace ON pg_namespace.oid = table_class.relnamespace
+        WHERE pg_namespace.nspname = $1
+          AND table_class.relname = ANY($2::text[])
+          AND NOT pg_index.indisprimary
+          AND NOT EXISTS (
+              SELECT 1 FROM pg_constraint
+              WHERE pg_constraint.conindid = pg_index.indexrelid
+          )
+        """
+
+        try:
+            async with db_pool.transaction():
+                indexes = await db_pool.fetch(query, schema, list(table_names))
+
+                for index_name, table_name, definition in indexes:
+                    await db_pool.execute(
+                        f"""
+                        INSERT INTO {schema}.{settings.ETL.TARGET_DB.DEFERRED_INDEX_TABLE}
+                        (index_name, table_name, definition) VALUES ($1, $2, $3)
+                        ON CONFLICT (index_name) DO NOTHING
+                        """,
+                        index_name,
+                        table_name,
+                        definition,
+                    )
+                    await db_pool.execute(f"DROP INDEX {schema}.{index_name}")
+        except Exception as err:
+            raise DBError from err
+
+    @Decorators.db_session
+    async def get_deferred_indexes(
+        self, db_pool: asyncpg.pool.Pool = None
+    ) -> t.List[t.Tuple[str, str]]:
+        """Get names and definitions of dropped indexes."""
+        query = f"""
+        SELECT index_name, definition
+        FROM {settings.ETL.TARGET_DB.SCHEMA}.{settings.ETL.TARGET_DB.DEFERRED_INDEX_TABLE}
+        """
+
+        try:
+            return [tuple(i) for i in await db_pool.fetch(query)]
+        except Exception as err:
+            raise DBError from err
+
+    @Decorators.db_session
+    async def build_deferred_index(
+        self, index_name: str, definition: str, db_pool: asyncpg.pool.Pool = None
+    ) -> None:
+        """Create the dropped index again and forget its definition."""
+        query = f"""
+        DELETE FROM
+        {settings.ETL.TARGET_DB.SCHEMA}.{settings.ETL.TARGET_DB.DEFERRED_INDEX_TABLE}
+        WHERE index_name = $1
+        """
+
+        try:
+            async with db_pool.transaction():
+                await db_pool.execute(definition)
+                await db_pool.execute(query, index_name)
+        except Exception as err:
+            raise DBError from err
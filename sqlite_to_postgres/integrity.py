@@ -0,0 +1,234 @@
+import asyncio
+import typing as t
+from array import array
+from bisect import bisect_left
+from enum import Enum
+from heapq import merge
+from itertools import islice
+from logging import getLogger
+from uuid import UUID
+
+from db_clients import (
+    BaseEnum,
+    FetchModeEnum,
+    RejectedRecord,
+    SQLiteDBClient,
+    TableFKFieldsEnum,
+    TableNameEnum,
+)
+
+logger = getLogger(__name__)
+
+# Поле таблицы связей -> родительская таблица, как у форен кеев из after_load.
+REFERENCES: t.Dict[str, t.Dict[str, str]] = {
+    TableNameEnum.genre_film_work.value: {
+        TableFKFieldsEnum.film_work_id.value: TableNameEnum.film_work.value,
+        TableFKFieldsEnum.genre_id.value: TableNameEnum.genre.value,
+    },
+    TableNameEnum.person_film_work.value: {
+        TableFKFieldsEnum.film_work_id.value: TableNameEnum.film_work.value,
+        TableFKFieldsEnum.person_id.value: TableNameEnum.person.value,
+    },
+}
+
+
+class IntegrityCheckEnum(str, BaseEnum):
+    # Не проверять ссылки до загрузки
+    off = "off"
+    # Писать строки с битыми ссылками в файл, но загружать их
+    report = "report"
+    # Писать строки с битыми ссылками в файл вместо загрузки
+    quarantine = "quarantine"
+
+
+class KeySet:
+    """
+    Set of uuid keys stored as two sorted arrays of their 64 bit halves, so a
+    key takes 16 bytes and a lookup is a binary search in C. Keys are expected
+    in sorted runs, e.g. one per source, freeze merges them.
+    """
+
+    MASK = (1 << 64) - 1
+    # Средняя длина отсортированного отрезка, с которой отрезки сливаются
+    MIN_MERGE_RUN = 64
+
+    def __init__(self):
+        self.high = array("Q")
+        self.low = array("Q")
+        # Начала отсортированных отрезков ключей
+        self._runs = [0]
+        self._last = -1
+
+    def __len__(self) -> int:
+        return len(self.high)
+
+    @staticmethod
+    def to_int(key: t.Union[UUID, str, bytes]) -> int:
+        if isinstance(key, UUID):
+            return key.int
+
+        if isinstance(key, bytes):
+            return int.from_bytes(key, "big")
+
+        return UUID(key).int
+
+    def add(self, key: t.Union[UUID, str, bytes]) -> None:
+        value = self.to_int(key)
+
+        if value < self._last:
+            self._runs.append(len(self.high))
+
+        self._last = value
+        self.high.append(value >> 64)
+        self.low.append(value & self.MASK)
+
+    def freeze(self) -> None:
+        """
+        Sort the keys if they were not added in order. Long sorted runs, e.g.
+        of several sources, are merged into new arrays pair by pair. Other
+        keys are sorted as one list of 128 bit ints, not of tuples.
+        """
+        if len(self._runs) == 1:
+            return
+
+        if len(self.high) // len(self._runs) >= self.MIN_MERGE_RUN:
+            bounds = [*self._runs, len(self.high)]
+            pairs = merge(
+                *[
+                    zip(islice(self.high, start, end), islice(self.low, start, end))
+                    for start, end in zip(bounds, bounds[1:])
+                ]
+            )
+            high, low = array("Q"), array("Q")
+
+            for high_value, low_value in pairs:
+                high.append(high_value)
+                low.append(low_value)
+        else:
+            values = sorted(i << 64 | j for i, j in zip(self.high, self.low))
+            high = array("Q", (i >> 64 for i in values))
+            low = array("Q", (i & self.MASK for i in values))
+
+        self.high, self.low = high, low
+        self._runs = [0]
+
+    def __contains__(self, key: t.Union[UUID, str, bytes]) -> bool:
+        try:
+            value = self.to_int(key)
+        except (TypeError, ValueError):
+            return False
+
+        high, low = value >> 64, value & self.MASK
+        index = bisect_left(self.high, high)
+
+        while index < len(self.high) and self.high[index] == high:
+            if self.low[index] == low:
+                return True
+
+            index += 1
+
+        return False
+
+
+class IntegrityChecker:
+    """
+    Check references of link rows before the load. Keys of the parent tables
+    are read from the source in the background, link rows wait only for the
+    key sets of their parents, not for the load of the parent tables.
+    read_keys gives chunks of keys of a table, by default from the sqlite source.
+    """
+
+    def __init__(
+        self,
+        read_keys: t.Optional[t.Callable[[str], t.AsyncIterator[t.Sequence]]] = None,
+    ):
+        self.read_keys = read_keys or self.read_source_keys
+        self.key_sets: t.Dict[str, KeySet] = {}
+        self._tasks: t.Dict[str, asyncio.Task] = {}
+
+    def start(self) -> None:
+        for parent in {j for i in REFERENCES.values() for j in i.values()}:
+            self._tasks[parent] = asyncio.create_task(self.build_key_set(parent))
+
+    async def close(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    async def build_key_set(self, table_name: str) -> KeySet:
+        key_set = KeySet()
+
+        async for keys in self.read_keys(table_name):
+            for key in keys:
+                try:
+                    key_set.add(key)
+                except (TypeError, ValueError):
+                    # Такую строку не пропустит валидация, на нее не сошлемся.
+                    continue
+
+        key_set.freeze()
+        self.key_sets[table_name] = key_set
+        logger.debug("%s keys of %s table are read", len(key_set), table_name)
+
+        return key_set
+
+    @staticmethod
+    async def read_source_keys(
+        table_name: str, db_names: t.Sequence[str] = (SQLiteDBClient.DB_NAME,)
+    ) -> t.AsyncIterator[t.List[str]]:
+        """
+        Read all keys of the table with its own sqlite connection. The whole
+        table is read, so resumed and incremental runs see the parents that
+        were loaded before. Keys of several sources are read one by one, each
+        in pk order, so KeySet gets a sorted run per source.
+        """
+        for db_name in db_names:
+            source_db_client = SQLiteDBClient(db_name)
+            await source_db_client.init_db()
+
+            try:
+                async for chunk in source_db_client.fetch(
+                    table_name,
+                    fields=(SQLiteDBClient.KEY_FIELD,),
+                    mode=FetchModeEnum.keyset,
+                    rows_limit=lambda: 10 * SQLiteDBClient.ROWS_LIMIT,
+                ):
+                    yield [row[0] for row in chunk]
+            finally:
+                await source_db_client.close_db()
+
+    async def check(
+        self,
+        table_name: str,
+        columns: t.Sequence[str],
+        records: t.Union[t.List[t.Dict[str, t.Any]], t.List[t.Tuple[t.Any, ...]]],
+    ) -> t.List[RejectedRecord]:
+        """Rows of the chunk that refer to missing parents, as tuples."""
+        references = REFERENCES.get(table_name)
+
+        if not references or not records:
+            return []
+
+        checks = [
+            (field, columns.index(field), await self._tasks[parent])
+            for field, parent in references.items()
+        ]
+        as_dicts = isinstance(records[0], dict)
+        orphans = []
+
+        for record in records:
+            values = tuple(record[i] for i in columns) if as_dicts else record
+            missing = [
+                field for field, index, keys in checks if values[index] not in keys
+            ]
+
+            if missing:
+                orphans.append(
+                    RejectedRecord(
+                        values,
+                        f"Missing parent of {', '.join(missing)}",
+                    )
+                )
+
+        return orphans
@@ -1,19 +1,44 @@
 import asyncio
+import hashlib
+import time
 import typing as t
 from abc import ABC, abstractmethod
+from enum import Enum
+from functools import partial, wraps
 from logging import getLogger
 
-from pydantic.main import BaseModel
+import pyarrow as pa
+import ujson
 
+from chunk_sizing import ChunkSizer
 from db_clients import (
     TableNameEnum,
+    Checkpoint,
+    Condition,
     SQLiteDBClient,
     PostgresDBClient,
     TableNameWithFKEnum,
     TableFKFieldsEnum,
     DBError,
+    FetchModeEnum,
+    LoadMethodEnum,
 )
+from integrity import IntegrityChecker, IntegrityCheckEnum
+from metrics import ETLMetrics
+from pipeline import MemoryBudget, Pipeline
+from record_codecs import get_codec
+from rejects import RejectWriter
 from schemas import SchemaByTableEnum
+from settings import settings
+from snapshot import SnapshotReader, SnapshotWriter
+from sources import (
+    Source,
+    SourceError,
+    SourceProgress,
+    find_duplicate_keys,
+    get_sources,
+)
+from transformers import ExecutorEnum, create_executor, transform_rows
 
 
 logger = getLogger(__name__)
@@ -23,6 +48,15 @@ class ETLError(Exception):
     pass
 
 
+class ETLModeEnum(str, Enum):
+    full = "full"
+    incremental = "incremental"
+    # Сохранить провалидированные строки в снапшот вместо загрузки в postgres
+    export = "export"
+    # Полная загрузка из снапшота без sqlite и валидации
+    snapshot = "snapshot"
+
+
 class ETL(ABC):
     @abstractmethod
     def extract(self, *args, **kwargs) -> t.AsyncIterator[None]:
@@ -38,41 +72,503 @@ class ETL(ABC):
 
 
 class MovieETL(ETL):
+    class Decorators:
+        @classmethod
+        def measure(cls, stage: str):
+            """Decorator for timing of the etl stage, it gets a chunk of the table."""
+
+            def decorator(decorated: t.Callable):
+                @wraps(decorated)
+                async def wrapper(self, table_name, data, *args, **kwargs):
+                    started_at = time.perf_counter()
+                    result = await decorated(self, table_name, data, *args, **kwargs)
+                    self.metrics.observe(table_name, stage, started_at, len(data))
+                    return result
+
+                return wrapper
+
+            return decorator
+
     def __init__(self):
         self.source_db_client: SQLiteDBClient = SQLiteDBClient()
         self.target_db_client: PostgresDBClient = PostgresDBClient()
+        self.load_method = LoadMethodEnum(settings.ETL.LOAD_METHOD)
+        self.mode = ETLModeEnum(settings.ETL.MODE)
+        self.failed_tables: t.Set[str] = set()
+        self.metrics = ETLMetrics()
+        self.chunk_sizers: t.Dict[str, ChunkSizer] = {}
+        self.memory_budget = (
+            MemoryBudget(settings.ETL.MEMORY_BUDGET)
+            if settings.ETL.MEMORY_BUDGET
+            else None
+        )
+        self.metrics.memory_budget = self.memory_budget
+        self.reject_writer = RejectWriter(settings.ETL.REJECT_FILE)
+        self.integrity_check = IntegrityCheckEnum(settings.ETL.INTEGRITY_CHECK)
+        self.integrity_checker = None
+
+        if self.mode == ETLModeEnum.snapshot:
+            self.integrity_checker = IntegrityChecker(self.read_snapshot_keys)
+        elif self.mode != ETLModeEnum.export:
+            self.integrity_checker = IntegrityChecker()
+
+        if self.integrity_check == IntegrityCheckEnum.off:
+            self.integrity_checker = None
+
+        self.orphan_writer = RejectWriter(settings.ETL.ORPHAN_FILE)
+        self.snapshot_writers: t.Dict[str, SnapshotWriter] = {}
+        # Загруженные пачки запоминаются по диапазонам ключей, поэтому
+        # продолжение прерванной загрузки работает только с keyset пагинацией.
+        self.resumable = self.mode == ETLModeEnum.full and settings.ETL.RESUME
+        self.fetch_mode = (
+            FetchModeEnum.keyset
+            if self.resumable
+            else FetchModeEnum(settings.ETL.FETCH_MODE)
+        )
+        self.executor_type = ExecutorEnum(settings.ETL.TRANSFORM_EXECUTOR)
+        self.executor = create_executor(
+            self.executor_type, settings.ETL.TRANSFORM_EXECUTOR_WORKERS
+        )
 
     async def run(self) -> None:
         """Run etl concurrently."""
         # Спасибо за комменты и особенно за коммент про асинхронность)
         # Я как-то действительно упустил этот момент
+        if self.mode == ETLModeEnum.export:
+            await self.run_stage(TableNameEnum.all_names())
+            return
+
+        try:
+            stages = await self.prepare_target()
+        except DBError as err:
+            raise ETLError from err
+
+        if self.integrity_checker:
+            self.integrity_checker.start()
+
+        try:
+            for stage in stages:
+                await self.run_stage(stage)
+        finally:
+            if self.integrity_checker:
+                await self.integrity_checker.close()
+
+        await self.after_load()
+
+    async def prepare_target(self) -> t.List[t.List[str]]:
+        """Prepare the target db for the mode and return stages of tables."""
+        await self.target_db_client.init_deferred_indexes()
+
+        if self.mode == ETLModeEnum.incremental:
+            await self.target_db_client.init_watermarks()
+            # Форен кеи уже могут быть в бд, поэтому сначала загружаем родительские
+            # таблицы, а потом таблицы связей.
+            return [
+                [
+                    i
+                    for i in TableNameEnum.all_names()
+                    if i not in TableNameWithFKEnum.all_names()
+                ],
+                TableNameWithFKEnum.all_names(),
+            ]
+
+        if self.mode == ETLModeEnum.full:
+            await self.target_db_client.init_checkpoints()
+
+            if not self.resumable:
+                # Загрузка с начала в уже заполненные таблицы упала бы на
+                # уникальности ключей каждой пачки. Несколько источников
+                # всегда загружаются с начала.
+                await self.target_db_client.truncate_tables(TableNameEnum.all_names())
+                await self.target_db_client.reset_checkpoints()
+
+        if settings.ETL.DEFER_INDEXES:
+            await self.target_db_client.defer_indexes(TableNameEnum.all_names())
+
+        await self.drop_foreign_keys()
+
+        return [TableNameEnum.all_names()]
+
+    async def run_stage(self, table_names: t.List[str]) -> None:
+        """Run etl of the tables concurrently, failed tables are remembered."""
         tasks: t.List[asyncio.Task] = []
 
-        for table_name in TableNameEnum.all_names():
+        for table_name in table_names:
             tasks.append(asyncio.create_task(self.run_etl_by_table_name(table_name)))
 
-        await asyncio.gather(*tasks, return_exceptions=True)
+        results = await asyncio.gather(*tasks, return_exceptions=True)
 
-        await self.after_load()
+        for table_name, result in zip(table_names, results):
+            if isinstance(result, Exception):
+                logger.error("ETL of %s table failed. Error: %r", table_name, result)
+                self.failed_tables.add(table_name)
 
     async def run_etl_by_table_name(self, table_name: TableNameEnum):
         """Run etl by table name."""
         try:
-            async for chunk in self.extract(table_name):
-                transformed_data = await self.transform(chunk)
-                await self.load(table_name, transformed_data)
+            if self.mode == ETLModeEnum.incremental:
+                await self.run_incremental_etl_by_table_name(table_name)
+                return
+
+            if self.mode == ETLModeEnum.export:
+                await self.run_export_by_table_name(table_name)
+                return
+
+            if self.mode == ETLModeEnum.snapshot:
+                await self.run_snapshot_etl_by_table_name(table_name)
+                return
+
+            if self.resumable:
+                await self.run_resumable_etl_by_table_name(table_name)
+                return
+
+            await self.run_pipeline(table_name)
         except Exception as err:
             raise ETLError from err
 
+    async def run_export_by_table_name(self, table_name: TableNameEnum):
+        """Extract and validate the table and write it to its snapshot file."""
+        writer = SnapshotWriter(settings.ETL.SNAPSHOT_DIR, table_name)
+        self.snapshot_writers[table_name] = writer
+
+        try:
+            await self.run_pipeline(table_name)
+        except BaseException:
+            writer.abort()
+            raise
+
+        writer.close()
+
+    async def run_snapshot_etl_by_table_name(self, table_name: TableNameEnum):
+        """Load the table from its snapshot file, rows are already validated."""
+        reader = SnapshotReader(settings.ETL.SNAPSHOT_DIR, table_name)
+
+        try:
+            await self.run_table_pipeline(
+                table_name,
+                source=self.read_snapshot(table_name, reader),
+                transform=partial(self.transform_snapshot, table_name),
+            )
+        finally:
+            reader.close()
+
+    async def run_resumable_etl_by_table_name(self, table_name: TableNameEnum):
+        """Run etl skipping the chunks loaded by previous runs."""
+        checkpoints = await self.target_db_client.get_checkpoints(table_name)
+
+        if any(i.finished for i in checkpoints):
+            logger.info("%s table has already been loaded", table_name)
+            return
+
+        condition = await self.get_resume_condition(table_name, checkpoints)
+        await self.run_pipeline(table_name, condition)
+
+        if table_name in self.failed_tables:
+            logger.warning(
+                "Some chunks of %s table were not loaded, run etl again to retry",
+                table_name,
+            )
+            return
+
+        await self.target_db_client.finish_checkpoints(table_name)
+
+    async def get_resume_condition(
+        self, table_name: TableNameEnum, checkpoints: t.List[Checkpoint]
+    ) -> t.Optional[Condition]:
+        """
+        Condition for rows that are not loaded yet. Loaders commit chunks out of
+        order, so the run continues after the last chunk of the contiguous prefix
+        and skips the key ranges of chunks loaded after a gap.
+        """
+        if not checkpoints:
+            return None
+
+        key = SQLiteDBClient.KEY_FIELD
+        # Первый диапазон - загруженное начало таблицы. Чанки без строк
+        # источника между ними сливаются в один диапазон, иначе каждый чанк
+        # после разрыва был бы своим условием с параметрами sqlite.
+        ranges = [["", ""]]
+
+        for checkpoint in checkpoints:
+            if await self.source_db_client.fetch_count(
+                table_name,
+                Condition(
+                    f"{key} > ? AND {key} < ?", (ranges[-1][1], checkpoint.first_key)
+                ),
+            ):
+                ranges.append([checkpoint.first_key, checkpoint.last_key])
+            else:
+                ranges[-1][1] = max(ranges[-1][1], checkpoint.last_key)
+
+        (_, last_key), *loaded_ranges = ranges
+        clauses = [f"{key} > ?"]
+        params = [last_key]
+
+        for first_key, range_last_key in loaded_ranges:
+            clauses.append(f"{key} NOT BETWEEN ? AND ?")
+            params.extend((first_key, range_last_key))
+
+        logger.info(
+            "Resume %s table after key %s, %s rows have already been loaded",
+            table_name,
+            last_key,
+            sum(i.rows_count for i in checkpoints),
+        )
+
+        return Condition(" AND ".join(clauses), tuple(params))
+
+    @staticmethod
+    def get_checkpoint(
+        table_name: TableNameEnum,
+        transformed_data: t.Union[
+            t.List[t.Dict[str, t.Any]], t.List[t.Tuple[t.Any, ...]]
+        ],
+    ) -> Checkpoint:
+        """Checkpoint of the chunk, the checksum is md5 of the chunk keys."""
+        if isinstance(transformed_data[0], dict):
+            keys = [str(i[SQLiteDBClient.KEY_FIELD]) for i in transformed_data]
+        else:
+            index = get_codec(table_name).columns.index(SQLiteDBClient.KEY_FIELD)
+            keys = [str(i[index]) for i in transformed_data]
+
+        return Checkpoint(
+            table_name=table_name,
+            first_key=min(keys),
+            last_key=max(keys),
+            rows_count=len(keys),
+            checksum=hashlib.md5("\n".join(keys).encode()).hexdigest(),
+        )
+
+    async def run_pipeline(
+        self, table_name: TableNameEnum, condition: t.Optional[Condition] = None
+    ) -> None:
+        """
+        Run extract, transform and load of the table chunks concurrently.
+        A big table is split to key ranges, every range has its own sqlite
+        connection and pipeline.
+        """
+        shards = await self.get_shards(table_name, condition)
+        chunk_sizer = self.get_chunk_sizer(table_name)
+
+        if chunk_sizer:
+            chunk_sizer.pipelines = len(shards)
+
+        if len(shards) == 1:
+            await self.run_shard_pipeline(table_name, condition, self.source_db_client)
+            return
+
+        logger.debug("Extract %s table in %s shards", table_name, len(shards))
+
+        tasks = [
+            asyncio.create_task(
+                self.run_shard(table_name, Condition.join(condition, shard))
+            )
+            for shard in shards
+        ]
+
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def get_shards(
+        self, table_name: TableNameEnum, condition: t.Optional[Condition] = None
+    ) -> t.List[t.Optional[Condition]]:
+        """Split rows of the table to key ranges of about ETL_SHARD_SIZE rows."""
+        count = await self.source_db_client.fetch_count(table_name, condition)
+        shards_count = min(
+            -(-count // settings.ETL.SHARD_SIZE), settings.ETL.MAX_SHARDS
+        )
+
+        if shards_count <= 1:
+            return [None]
+
+        bounds = await self.source_db_client.fetch_shard_bounds(
+            table_name, shards_count, condition
+        )
+        key = SQLiteDBClient.KEY_FIELD
+        shards = []
+
+        for lower, upper in zip([None, *bounds], [*bounds, None]):
+            if lower is None:
+                shards.append(Condition(f"{key} <= ?", (upper,)))
+            elif upper is None:
+                shards.append(Condition(f"{key} > ?", (lower,)))
+            else:
+                shards.append(Condition(f"{key} > ? AND {key} <= ?", (lower, upper)))
+
+        return shards
+
+    async def run_shard(
+        self, table_name: TableNameEnum, condition: t.Optional[Condition]
+    ) -> None:
+        """Run pipeline of the table key range with its own sqlite connection."""
+        source_db_client = SQLiteDBClient(self.source_db_client.db_name)
+        await source_db_client.init_db()
+
+        try:
+            await self.run_shard_pipeline(table_name, condition, source_db_client)
+        finally:
+            await source_db_client.close_db()
+
+    async def run_shard_pipeline(
+        self,
+        table_name: TableNameEnum,
+        condition: t.Optional[Condition],
+        source_db_client: SQLiteDBClient,
+    ) -> None:
+        await self.run_table_pipeline(
+            table_name,
+            source=self.extract(table_name, condition, source_db_client),
+            transform=partial(self.transform, table_name),
+        )
+
+    async def run_table_pipeline(
+        self,
+        table_name: TableNameEnum,
+        source: t.AsyncIterable[t.Any],
+        transform: t.Callable[[t.Any], t.Awaitable[t.Any]],
+    ) -> None:
+        pipeline = Pipeline(
+            source=source,
+            transform=transform,
+            load=partial(self.load, table_name),
+            transform_workers=settings.ETL.TRANSFORM_WORKERS,
+            load_workers=settings.ETL.LOAD_WORKERS,
+            queue_size=settings.ETL.QUEUE_SIZE,
+            memory_budget=self.memory_budget,
+            weigh=partial(self.weigh_chunk, table_name),
+        )
+        self.metrics.watch(table_name, pipeline)
+
+        try:
+            await pipeline.run()
+        finally:
+            self.metrics.unwatch(table_name, pipeline)
+
+    async def run_incremental_etl_by_table_name(self, table_name: TableNameEnum):
+        """Run etl only for rows changed since the last run of the table."""
+        field = self.get_watermark_field(table_name)
+        watermark = await self.target_db_client.get_watermark(table_name)
+        # Верхнюю границу фиксируем заранее: строки, измененные во время загрузки,
+        # попадут в следующий запуск.
+        new_watermark = await self.source_db_client.fetch_max(table_name, field)
+
+        if watermark is None:
+            condition = Condition(f"{field} IS NULL OR {field} <= ?", (new_watermark,))
+        elif new_watermark is None or new_watermark <= watermark:
+            logger.debug("No changes in %s table since %s", table_name, watermark)
+            return
+        else:
+            condition = Condition(
+                f"{field} > ? AND {field} <= ?", (watermark, new_watermark)
+            )
+
+        await self.run_pipeline(table_name, condition)
+
+        if table_name in self.failed_tables:
+            logger.warning(
+                "Some chunks of %s table were not loaded, watermark %s is kept",
+                table_name,
+                watermark,
+            )
+            return
+
+        if new_watermark is not None:
+            await self.target_db_client.set_watermark(table_name, new_watermark)
+
+    @staticmethod
+    def get_watermark_field(table_name: TableNameEnum) -> str:
+        """Table field that changes when a row changes."""
+        fields = getattr(SchemaByTableEnum, table_name).value.__fields__
+        return "updated_at" if "updated_at" in fields else "created_at"
+
+    def get_chunk_sizer(self, table_name: TableNameEnum) -> t.Optional[ChunkSizer]:
+        """Chunk size of the table shared by all its shards, None if it is fixed."""
+        if not settings.ETL.ADAPTIVE_CHUNK_SIZE:
+            return None
+
+        if table_name not in self.chunk_sizers:
+            # Пачки в очередях, у воркеров и у читателя одного пайплайна.
+            chunks_in_flight = (
+                2 * settings.ETL.QUEUE_SIZE
+                + settings.ETL.TRANSFORM_WORKERS
+                + settings.ETL.LOAD_WORKERS
+                + 1
+            )
+            self.chunk_sizers[table_name] = ChunkSizer(
+                table_name,
+                initial_size=settings.ETL.CHUNK_SIZE,
+                min_size=settings.ETL.MIN_CHUNK_SIZE,
+                max_size=settings.ETL.MAX_CHUNK_SIZE,
+                target_seconds=settings.ETL.CHUNK_TARGET_SECONDS,
+                memory_budget=self.get_chunk_memory_budget(),
+                chunks_in_flight=chunks_in_flight,
+            )
+
+        return self.chunk_sizers[table_name]
+
+    def get_chunk_memory_budget(self) -> int:
+        """Memory for chunks of one table, tables share the global budget."""
+        if not settings.ETL.MEMORY_BUDGET:
+            return settings.ETL.CHUNK_MEMORY_BUDGET
+
+        return min(
+            settings.ETL.CHUNK_MEMORY_BUDGET,
+            settings.ETL.MEMORY_BUDGET // len(TableNameEnum.all_names()),
+        )
+
+    def weigh_chunk(
+        self, table_name: TableNameEnum, raw_data: t.List[t.Sequence[t.Any]]
+    ) -> int:
+        """
+        Estimated bytes of the chunk until it is loaded: extracted rows and
+        transformed records of about the same size live together in transform.
+        """
+        chunk_sizer = self.chunk_sizers.get(table_name)
+
+        if chunk_sizer and chunk_sizer.bytes_per_row:
+            bytes_per_row = chunk_sizer.bytes_per_row
+        else:
+            if isinstance(raw_data, pa.RecordBatch):
+                sample = SnapshotReader.to_records(
+                    raw_data.slice(0, ChunkSizer.SAMPLE_ROWS)
+                )
+            else:
+                sample = raw_data[: ChunkSizer.SAMPLE_ROWS]
+
+            bytes_per_row = sum(ChunkSizer.get_row_size(i) for i in sample) / max(
+                len(sample), 1
+            )
+
+        return int(2 * bytes_per_row * len(raw_data))
+
     async def extract(
-        self, table_name: TableNameEnum
-    ) -> t.AsyncIterator[t.List[BaseModel]]:
-        """Extract data from source."""
-        schema = getattr(SchemaByTableEnum, table_name)
+        self,
+        table_name: TableNameEnum,
+        condition: t.Optional[Condition] = None,
+        source_db_client: t.Optional[SQLiteDBClient] = None,
+    ) -> t.AsyncIterator[t.List[t.Sequence[t.Any]]]:
+        """Extract raw rows in the order of the table codec columns."""
+        source_db_client = source_db_client or self.source_db_client
+        chunk_sizer = self.get_chunk_sizer(table_name)
+        started_at = time.perf_counter()
 
-        async for chunk in self.source_db_client.fetch(
-            table_name, mapping_schema=schema.value
+        async for chunk in source_db_client.fetch(
+            table_name,
+            fields=get_codec(table_name).columns,
+            mode=self.fetch_mode,
+            condition=condition,
+            rows_limit=chunk_sizer,
         ):
+            self.metrics.observe(table_name, "extract", started_at, len(chunk))
+
+            if chunk_sizer:
+                chunk_sizer.observe_rows(chunk)
+
             logger.debug(
                 "Success extraction data from %s table, chunk len %s",
                 table_name,
@@ -81,9 +577,12 @@ class MovieETL(ETL):
 
             yield chunk
 
+            started_at = time.perf_counter()
+
+    @Decorators.measure("transform")
     async def transform(
-        self, raw_data: t.List[BaseModel]
-    ) -> t.List[t.Dict[str, t.Any]]:
+        self, table_name: TableNameEnum, raw_data: t.List[t.Sequence[t.Any]]
+    ) -> t.Union[t.List[t.Dict[str, t.Any]], t.List[t.Tuple[t.Any, ...]]]:
         """Transform extracted data."""
         # В комменте был вопрос, поэтому я отвечаю. Не очень хочется связывать
         # пидантик схемы с клиентом к бд, т.к. в схемах может быть дополнительная
@@ -91,32 +590,252 @@ class MovieETL(ETL):
         # логика. Кажется, что логичней будет в клиент к бд передавать уже обработанные
         # примитивные данные. В клиенте к sqlite я использовал конвертацию словарей в
         # пидантик, но сделал это как необязательное дополнение.
-        return [data.dict() for data in raw_data]
+        as_records = self.load_method == LoadMethodEnum.binary or self.mode in (
+            ETLModeEnum.incremental,
+            ETLModeEnum.export,
+        )
+
+        fast = settings.ETL.FAST_TRANSFORM
 
+        if not self.executor:
+            return transform_rows(table_name, raw_data, as_records, fast)
+
+        # Валидация пидантиком - это чистый cpu, поэтому отдаем пачку строк в пул,
+        # чтобы не блокировать event loop и загрузку остальных таблиц.
+        if self.executor_type == ExecutorEnum.process:
+            raw_data = [tuple(row) for row in raw_data]
+
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, transform_rows, table_name, raw_data, as_records, fast
+        )
+
+    async def read_snapshot(
+        self, table_name: TableNameEnum, reader: SnapshotReader
+    ) -> t.AsyncIterator[pa.RecordBatch]:
+        """Slices of the snapshot batches, they are not copied until transform."""
+        chunk_sizer = self.get_chunk_sizer(table_name)
+        started_at = time.perf_counter()
+
+        for batch in reader.iter_batches(
+            chunk_sizer or (lambda: SQLiteDBClient.ROWS_LIMIT)
+        ):
+            self.metrics.observe(table_name, "extract", started_at, batch.num_rows)
+
+            yield batch
+
+            started_at = time.perf_counter()
+
+    async def read_snapshot_keys(
+        self, table_name: TableNameEnum
+    ) -> t.AsyncIterator[t.List[bytes]]:
+        """Keys of the table from its snapshot for the integrity check."""
+        reader = SnapshotReader(settings.ETL.SNAPSHOT_DIR, table_name)
+
+        try:
+            for batch in reader.iter_batches(lambda: 10 * SQLiteDBClient.ROWS_LIMIT):
+                index = batch.schema.get_field_index(SQLiteDBClient.KEY_FIELD)
+                yield batch.column(index).to_pylist()
+                # Не держим event loop на больших снапшотах.
+                await asyncio.sleep(0)
+        finally:
+            reader.close()
+
+    @Decorators.measure("transform")
+    async def transform_snapshot(
+        self, table_name: TableNameEnum, batch: pa.RecordBatch
+    ) -> t.List[t.Tuple[t.Any, ...]]:
+        """Records of the snapshot batch for the binary COPY."""
+        records = SnapshotReader.to_records(batch)
+
+        if table_name in self.chunk_sizers:
+            self.chunk_sizers[table_name].observe_rows(records)
+
+        return records
+
+    @Decorators.measure("load")
     async def load(
-        self, table_name: TableNameEnum, transformed_data: t.List[t.Dict[str, t.Any]]
+        self,
+        table_name: TableNameEnum,
+        transformed_data: t.Union[
+            t.List[t.Dict[str, t.Any]], t.List[t.Tuple[t.Any, ...]]
+        ],
     ) -> None:
         """Load transformed data to target."""
         if not transformed_data:
             return
 
+        if self.mode == ETLModeEnum.export:
+            self.snapshot_writers[table_name].write(transformed_data)
+            return
+
+        checkpoint = None
+
+        if self.resumable:
+            checkpoint = self.get_checkpoint(table_name, transformed_data)
+
+        if self.integrity_checker:
+            transformed_data = await self.check_integrity(table_name, transformed_data)
+
+            if not transformed_data:
+                # Вся пачка в карантине, но в следующий запуск она не нужна.
+                if checkpoint:
+                    await self.target_db_client.insert_by_binary_copy(
+                        table_name, get_codec(table_name).columns, [], checkpoint
+                    )
+
+                return
+
+        started_at = time.perf_counter()
+
         try:
-            await self.target_db_client.insert_by_copy(table_name, transformed_data)
+            if self.mode == ETLModeEnum.incremental:
+                await self.target_db_client.upsert_by_copy(
+                    table_name, get_codec(table_name).columns, transformed_data
+                )
+            elif (
+                self.load_method == LoadMethodEnum.binary
+                or self.mode == ETLModeEnum.snapshot
+            ):
+                await self.target_db_client.insert_by_binary_copy(
+                    table_name,
+                    get_codec(table_name).columns,
+                    transformed_data,
+                    checkpoint,
+                )
+            else:
+                await self.target_db_client.insert_by_copy(
+                    table_name, transformed_data, checkpoint
+                )
+
+            if table_name in self.chunk_sizers:
+                self.chunk_sizers[table_name].observe_load(
+                    len(transformed_data), time.perf_counter() - started_at
+                )
+
             logger.debug(
                 "Success load data to %s table, chunk len %s",
                 table_name,
                 len(transformed_data),
             )
         except DBError as err:
+            if settings.ETL.BISECT_FAILED_CHUNKS:
+                await self.load_isolating_rejects(
+                    table_name, transformed_data, checkpoint, err
+                )
+                return
+
             logger.exception("Failed to load data to db! Error: %s", err)
+            self.failed_tables.add(table_name)
             # skip this chunk
             return
 
-    async def after_load(self):
-        """Call it when the etl is done."""
+    async def check_integrity(
+        self,
+        table_name: TableNameEnum,
+        transformed_data: t.Union[
+            t.List[t.Dict[str, t.Any]], t.List[t.Tuple[t.Any, ...]]
+        ],
+    ) -> t.Union[t.List[t.Dict[str, t.Any]], t.List[t.Tuple[t.Any, ...]]]:
+        """
+        Write rows with missing parents to the orphan file. In quarantine mode
+        they are removed from the chunk, so foreign keys validate after the load.
+        """
+        columns = get_codec(table_name).columns
+        orphans = await self.integrity_checker.check(
+            table_name, columns, transformed_data
+        )
+
+        if not orphans:
+            return transformed_data
+
+        logger.warning(
+            "%s rows of %s table refer to missing parents, see %s",
+            len(orphans),
+            table_name,
+            self.orphan_writer.path,
+        )
+        self.orphan_writer.write(table_name, columns, orphans)
+
+        if self.integrity_check == IntegrityCheckEnum.report:
+            return transformed_data
+
+        key = SQLiteDBClient.KEY_FIELD
+        index = columns.index(key)
+        orphan_keys = {i.record[index] for i in orphans}
+
+        if isinstance(transformed_data[0], dict):
+            return [i for i in transformed_data if i[key] not in orphan_keys]
+
+        return [i for i in transformed_data if i[index] not in orphan_keys]
+
+    async def load_isolating_rejects(
+        self,
+        table_name: TableNameEnum,
+        transformed_data: t.Union[
+            t.List[t.Dict[str, t.Any]], t.List[t.Tuple[t.Any, ...]]
+        ],
+        checkpoint: t.Optional[Checkpoint],
+        error: DBError,
+    ) -> None:
+        """Load the failed chunk again without its bad rows, they are written out."""
+        logger.warning(
+            "Failed to load chunk of %s table, looking for bad rows. Error: %r",
+            table_name,
+            error.__cause__,
+        )
+        columns = get_codec(table_name).columns
+
+        if isinstance(transformed_data[0], dict):
+            transformed_data = [tuple(i[j] for j in columns) for i in transformed_data]
+
         try:
-            for table_name in TableNameWithFKEnum.all_names():
-                await self.target_db_client.add_foreign_key(
+            rejected = await self.target_db_client.insert_isolating_rejects(
+                table_name,
+                columns,
+                transformed_data,
+                checkpoint,
+                upsert=self.mode == ETLModeEnum.incremental,
+            )
+        except DBError as err:
+            logger.exception("Failed to load data to db! Error: %s", err)
+            self.failed_tables.add(table_name)
+            return
+
+        logger.warning(
+            "%s rows of %s table are rejected to %s",
+            len(rejected),
+            table_name,
+            self.reject_writer.path,
+        )
+
+        try:
+            self.reject_writer.write(table_name, columns, rejected)
+        except OSError as err:
+            # Остальные строки пачки уже в бд, поэтому в лог пишем сами строки.
+            logger.exception(
+                "Failed to write rejected rows %s. Error: %s", rejected, err
+            )
+
+    async def add_foreign_key(self, **kwargs) -> t.Tuple[str, str]:
+        """
+        Add NOT VALID foreign key if the target table doesn't have it yet.
+        Returns table and name of the key to validate.
+        """
+        table_name, fk_name = kwargs["target_table_name"], kwargs["fk_name"]
+
+        if not await self.target_db_client.constraint_exists(table_name, fk_name):
+            await self.target_db_client.add_foreign_key(**kwargs, not_valid=True)
+
+        return table_name, fk_name
+
+    @staticmethod
+    def get_foreign_keys() -> t.List[t.Dict[str, t.Any]]:
+        """Foreign keys of the link tables as kwargs of add_foreign_key."""
+        foreign_keys = []
+
+        for table_name in TableNameWithFKEnum.all_names():
+            foreign_keys.append(
+                dict(
                     target_table_name=table_name,
                     reference_table_name=TableNameEnum.film_work.value,
                     fk_name=TableFKFieldsEnum.get_fk(
@@ -125,9 +844,11 @@ class MovieETL(ETL):
                     fk_field=TableFKFieldsEnum.film_work_id.value,
                     on_delete_cascade=True,
                 )
+            )
 
-                if table_name == TableNameEnum.genre_film_work:
-                    await self.target_db_client.add_foreign_key(
+            if table_name == TableNameEnum.genre_film_work:
+                foreign_keys.append(
+                    dict(
                         target_table_name=table_name,
                         reference_table_name=TableNameEnum.genre.value,
                         fk_name=TableFKFieldsEnum.get_fk(
@@ -135,22 +856,336 @@ class MovieETL(ETL):
                         ),
                         fk_field=TableFKFieldsEnum.genre_id.value,
                     )
-                    continue
+                )
+                continue
 
-                await self.target_db_client.add_foreign_key(
+            foreign_keys.append(
+                dict(
                     target_table_name=table_name,
                     reference_table_name=TableNameEnum.person.value,
                     fk_name=TableFKFieldsEnum.get_fk(TableFKFieldsEnum.person_id.value),
                     fk_field=TableFKFieldsEnum.person_id.value,
                 )
+            )
+
+        return foreign_keys
+
+    async def drop_foreign_keys(self) -> None:
+        """
+        Drop foreign keys of a previous run before a full load. NOT VALID keys
+        still check new rows, and link tables are loaded together with their
+        parents. after_load adds the keys back and validates them.
+        """
+        for foreign_key in self.get_foreign_keys():
+            await self.target_db_client.drop_constraint(
+                foreign_key["target_table_name"], foreign_key["fk_name"]
+            )
+
+    async def after_load(self):
+        """Call it when the etl is done."""
+        foreign_keys: t.List[t.Tuple[str, str]] = []
+
+        try:
+            for foreign_key in self.get_foreign_keys():
+                foreign_keys.append(await self.add_foreign_key(**foreign_key))
         except DBError as err:
             logger.exception("Failed to set foreign keys. Error: %s", err)
 
+        await self.build_constraints(foreign_keys)
+        await self.refresh_read_model()
+
+    def get_server_settings(self) -> t.Dict[str, str]:
+        """Settings of target db sessions, see PostgresDBClient.init_db."""
+        if settings.ETL.REFRESH_READ_MODEL and self.mode != ETLModeEnum.incremental:
+            # Триггеры пересчитывали бы фильмы каждой пачки COPY, а после
+            # полной загрузки дешевле один раз пересобрать таблицу.
+            return {PostgresDBClient.READ_MODEL_SYNC: "off"}
+
+        return {}
+
+    async def refresh_read_model(self) -> None:
+        if not settings.ETL.REFRESH_READ_MODEL or self.mode == ETLModeEnum.incremental:
+            return
+
+        try:
+            if not await self.target_db_client.refresh_read_model():
+                logger.info("No read model in the target db, skip its refresh")
+        except DBError as err:
+            logger.error("Failed to refresh the read model. Error: %r", err.__cause__)
+
+    async def build_constraints(self, foreign_keys: t.List[t.Tuple[str, str]]):
+        """
+        Validate foreign keys and build deferred indexes. Both scan whole tables,
+        so they run in parallel on connections of the pool.
+        """
+        indexes = []
+
+        try:
+            indexes = await self.target_db_client.get_deferred_indexes()
+        except DBError as err:
+            logger.exception("Failed to get deferred indexes. Error: %s", err)
+
+        if indexes and self.failed_tables:
+            # Следующий запуск дозагрузит данные, поэтому индексы пока не строим.
+            logger.warning("Indexes stay deferred until all tables are loaded")
+            indexes = []
+
+        jobs = [
+            *[
+                self.target_db_client.validate_constraint(table_name, fk_name)
+                for table_name, fk_name in foreign_keys
+            ],
+            *[
+                self.target_db_client.build_deferred_index(index_name, definition)
+                for index_name, definition in indexes
+            ],
+        ]
+        names = [*[i[1] for i in foreign_keys], *[i[0] for i in indexes]]
+
+        for name, result in zip(
+            names, await asyncio.gather(*jobs, return_exceptions=True)
+        ):
+            if isinstance(result, Exception):
+                logger.error("Failed to build %s. Error: %r", name, result.__cause__)
+
+
+class SourceETL(MovieETL):
+    """
+    Etl of one source of MultiSourceETL. The target pool, the transform
+    executor, metrics, memory budget, integrity check and reject files are
+    shared by all sources, the sqlite connection and chunk sizes are own.
+    """
+
+    def __init__(self, parent: "MultiSourceETL", source: Source):
+        # Родительский __init__ не нужен: пулы и файлы общие у всех источников.
+        self.parent = parent
+        self.source = source
+        self.source_db_client = SQLiteDBClient(source.path)
+        self.target_db_client = parent.target_db_client
+        self.load_method = parent.load_method
+        self.mode = parent.mode
+        self.failed_tables = set()
+        self.metrics = parent.metrics
+        self.chunk_sizers = {}
+        self.memory_budget = parent.memory_budget
+        self.reject_writer = parent.reject_writer
+        self.integrity_check = parent.integrity_check
+        self.integrity_checker = parent.integrity_checker
+        self.orphan_writer = parent.orphan_writer
+        self.snapshot_writers = {}
+        self.resumable = False
+        self.fetch_mode = parent.fetch_mode
+        self.executor_type = parent.executor_type
+        self.executor = parent.executor
+        self.pipelines = asyncio.Semaphore(settings.ETL.SOURCE_PIPELINES)
+
+    async def run_etl_by_table_name(self, table_name: TableNameEnum):
+        """Load all rows of the table from the source."""
+        # Водяные знаки хранятся по таблицам, а не по источникам, поэтому
+        # в инкрементальном режиме источник просто загружается через upsert.
+        try:
+            await self.run_pipeline(table_name)
+        except Exception as err:
+            raise ETLError from err
+
+    async def run_table_pipeline(
+        self,
+        table_name: TableNameEnum,
+        source: t.AsyncIterable[t.Any],
+        transform: t.Callable[[t.Any], t.Awaitable[t.Any]],
+    ) -> None:
+        async with self.pipelines:
+            await super().run_table_pipeline(table_name, source, transform)
+
+    def get_chunk_memory_budget(self) -> int:
+        """Tables of several sources are loaded at once."""
+        return super().get_chunk_memory_budget() // min(
+            settings.ETL.SOURCE_CONCURRENCY, len(self.parent.sources)
+        )
+
+    async def extract(
+        self,
+        table_name: TableNameEnum,
+        condition: t.Optional[Condition] = None,
+        source_db_client: t.Optional[SQLiteDBClient] = None,
+    ) -> t.AsyncIterator[t.List[t.Sequence[t.Any]]]:
+        """Extract rows without the keys that are loaded from other sources."""
+        duplicates = self.parent.duplicate_keys[table_name][self.source.index]
+        index = get_codec(table_name).columns.index(SQLiteDBClient.KEY_FIELD)
+
+        async for chunk in super().extract(table_name, condition, source_db_client):
+            if duplicates:
+                chunk = [row for row in chunk if row[index] not in duplicates]
+
+            if chunk:
+                yield chunk
+
+    async def load(
+        self,
+        table_name: TableNameEnum,
+        transformed_data: t.Union[
+            t.List[t.Dict[str, t.Any]], t.List[t.Tuple[t.Any, ...]]
+        ],
+    ) -> None:
+        await super().load(table_name, transformed_data)
+        self.parent.progress.advance(self.source.index, len(transformed_data))
+
+
+class MultiSourceETL(MovieETL):
+    """
+    Load several sqlite sources concurrently into one postgres pool. Every
+    stage of tables runs over all sources, SOURCE_CONCURRENCY of them at once.
+    Keys found in several sources are looked up before the load, so a row is
+    loaded only from the source with its latest version.
+    """
+
+    def __init__(self, sources: t.List[Source]):
+        super().__init__()
+        self.sources = sources
+        self.resumable = False
+        self.fetch_mode = FetchModeEnum(settings.ETL.FETCH_MODE)
+        self.progress = SourceProgress(sources)
+        self.metrics.sources = self.progress
+        self.duplicate_keys: t.Dict[str, t.List[t.Set[str]]] = {}
+        self.semaphore = asyncio.Semaphore(settings.ETL.SOURCE_CONCURRENCY)
+
+        if self.integrity_checker:
+            # Родительская строка может прийти в другом источнике.
+            self.integrity_checker = IntegrityChecker(
+                partial(
+                    IntegrityChecker.read_source_keys,
+                    db_names=[i.path for i in sources],
+                )
+            )
+
+        self.source_etls = [SourceETL(self, i) for i in sources]
+
+    async def run(self) -> None:
+        if self.mode not in (ETLModeEnum.full, ETLModeEnum.incremental):
+            raise ETLError(f"{self.mode.value} mode works only with one source")
+
+        try:
+            await self.find_duplicate_keys()
+        except SourceError as err:
+            raise ETLError from err
+
+        reporter = asyncio.create_task(
+            self.run_progress_reporter(settings.ETL.SOURCE_PROGRESS_INTERVAL)
+        )
+
+        try:
+            await super().run()
+        finally:
+            reporter.cancel()
+            self.log_progress()
+
+    async def find_duplicate_keys(self) -> None:
+        """Count rows of the sources and find keys that are in several of them."""
+        loop = asyncio.get_running_loop()
+        paths = [i.path for i in self.sources]
+        table_names = TableNameEnum.all_names()
+        results = await asyncio.gather(
+            *[
+                loop.run_in_executor(
+                    self.executor,
+                    find_duplicate_keys,
+                    paths,
+                    table_name,
+                    self.get_watermark_field(table_name),
+                )
+                for table_name in table_names
+            ]
+        )
+
+        for table_name, source_keys in zip(table_names, results):
+            self.duplicate_keys[table_name] = source_keys.duplicates
+            self.progress.add(source_keys)
+            duplicates = sum(len(i) for i in source_keys.duplicates)
+
+            if duplicates:
+                logger.info(
+                    "%s rows of %s table have newer versions in other sources",
+                    duplicates,
+                    table_name,
+                )
+
+    async def run_stage(self, table_names: t.List[str]) -> None:
+        await asyncio.gather(
+            *[self.run_source_stage(i, table_names) for i in self.source_etls]
+        )
+
+    async def run_source_stage(
+        self, source_etl: SourceETL, table_names: t.List[str]
+    ) -> None:
+        """Run the tables of the source, sqlite is open only while it runs."""
+        async with self.semaphore:
+            try:
+                await source_etl.source_db_client.init_db()
+            except DBError as err:
+                logger.error(
+                    "Failed to open %s source. Error: %r",
+                    source_etl.source.path,
+                    err.__cause__,
+                )
+                source_etl.failed_tables.update(table_names)
+            else:
+                try:
+                    await source_etl.run_stage(table_names)
+                finally:
+                    await source_etl.source_db_client.close_db()
+
+        if source_etl.failed_tables:
+            self.failed_tables.update(source_etl.failed_tables)
+            self.progress.failed.add(source_etl.source.index)
+
+    def log_progress(self) -> None:
+        progress = self.progress.to_dict()
+        logger.info(
+            "Sources: %s of %s finished, %s failed. Rows: %s of %s (%s%%), "
+            "%s rows/s, %s duplicates skipped",
+            progress["finished"],
+            progress["sources"],
+            progress["failed"],
+            progress["loaded_rows"],
+            progress["rows"],
+            progress["percent"],
+            progress["rows_per_second"],
+            progress["duplicate_rows"],
+        )
+
+    async def run_progress_reporter(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            self.log_progress()
+
+
+def create_etl() -> MovieETL:
+    if not settings.ETL.SOURCE_DBS:
+        return MovieETL()
+
+    return MultiSourceETL(get_sources(settings.ETL.SOURCE_DBS))
+
 
 async def run_movie_etl():
-    etl = MovieETL()
-    await etl.source_db_client.init_db()
-    await etl.target_db_client.init_db()
+    try:
+        etl = create_etl()
+    except SourceError as err:
+        logger.error("ETL failed! Error: %s", err)
+        return
+
+    # Загрузке из снапшота sqlite не нужна, а несколько источников открываются
+    # по очереди.
+    if etl.mode != ETLModeEnum.snapshot and not isinstance(etl, MultiSourceETL):
+        await etl.source_db_client.init_db()
+
+    if etl.mode != ETLModeEnum.export:
+        await etl.target_db_client.init_db(etl.get_server_settings())
+
+    sampler = asyncio.create_task(
+        etl.metrics.run_sampler(
+            settings.ETL.METRICS_INTERVAL, settings.ETL.PROMETHEUS_FILE
+        )
+    )
 
     try:
         await etl.run()
@@ -158,10 +1193,45 @@ async def run_movie_etl():
         logger.exception("ETL failed! Error: %s", err)
         return
     finally:
-        await etl.source_db_client.close_db()
+        if etl.source_db_client.database:
+            await etl.source_db_client.close_db()
+
+        if etl.executor:
+            etl.executor.shutdown()
+
+        sampler.cancel()
+        report_metrics(etl.metrics)
+
+        if etl.orphan_writer.count:
+            logger.warning(
+                "%s rows refer to missing parents, see %s",
+                etl.orphan_writer.count,
+                etl.orphan_writer.path,
+            )
+
+        if etl.reject_writer.count:
+            logger.warning(
+                "%s rows were rejected, see %s",
+                etl.reject_writer.count,
+                etl.reject_writer.path,
+            )
 
     logger.info("All data has been processed.")
 
 
+def report_metrics(metrics: ETLMetrics) -> None:
+    """Log the metrics summary and write it to the files from settings."""
+    logger.info("ETL metrics: %s", ujson.dumps(metrics.summary()))
+
+    try:
+        if settings.ETL.METRICS_FILE:
+            metrics.write_summary(settings.ETL.METRICS_FILE)
+
+        if settings.ETL.PROMETHEUS_FILE:
+            metrics.write_prometheus(settings.ETL.PROMETHEUS_FILE)
+    except OSError as err:
+        logger.exception("Failed to write metrics. Error: %s", err)
+
+
 if __name__ == "__main__":
     asyncio.run(run_movie_etl())
@@ -0,0 +1,263 @@
+import asyncio
+import os
+import resource
+import sys
+import time
+import typing as t
+from collections import defaultdict
+from logging import getLogger
+
+import ujson
+
+logger = getLogger(__name__)
+
+
+class Histogram:
+    """Cumulative histogram with prometheus style buckets."""
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self.counts = [0] * len(self.BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        for index, bound in enumerate(self.BUCKETS):
+            if value <= bound:
+                self.counts[index] += 1
+
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        return {
+            "buckets": {str(i): j for i, j in zip(self.BUCKETS, self.counts)},
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "max": round(self.max, 6),
+        }
+
+
+class StageMetrics:
+    def __init__(self):
+        self.rows = 0
+        self.chunks = 0
+        self.busy_seconds = 0.0
+        self.started_at: t.Optional[float] = None
+        self.finished_at: t.Optional[float] = None
+        self.latency = Histogram()
+
+    @property
+    def wall_seconds(self) -> float:
+        if self.started_at is None:
+            return 0.0
+
+        return self.finished_at - self.started_at
+
+    def observe(self, started_at: float, finished_at: float, rows: int) -> None:
+        if self.started_at is None:
+            self.started_at = started_at
+
+        self.finished_at = finished_at
+        self.rows += rows
+        self.chunks += 1
+        self.busy_seconds += finished_at - started_at
+        self.latency.observe(finished_at - started_at)
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        wall_seconds = self.wall_seconds
+
+        return {
+            "rows": self.rows,
+            "chunks": self.chunks,
+            "wall_seconds": round(wall_seconds, 6),
+            "busy_seconds": round(self.busy_seconds, 6),
+            "rows_per_second": round(self.rows / wall_seconds) if wall_seconds else 0,
+            "chunk_latency_seconds": self.latency.to_dict(),
+        }
+
+
+class QueueMetrics:
+    def __init__(self):
+        self.depth = 0
+        self.max_depth = 0
+        self.samples = 0
+        self.depth_sum = 0
+
+    def observe(self, depth: int) -> None:
+        self.depth = depth
+        self.max_depth = max(self.max_depth, depth)
+        self.samples += 1
+        self.depth_sum += depth
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        return {
+            "max_depth": self.max_depth,
+            "mean_depth": (
+                round(self.depth_sum / self.samples, 3) if self.samples else 0
+            ),
+        }
+
+
+class ETLMetrics:
+    """
+    Timings of the etl stages by tables, queue depths of the pipelines and
+    peak memory. Stages report every chunk with observe(), queues are sampled
+    by run_sampler().
+    """
+
+    QUEUES = ("transform_queue", "load_queue")
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages: t.Dict[str, t.Dict[str, StageMetrics]] = defaultdict(
+            lambda: defaultdict(StageMetrics)
+        )
+        self.queues: t.Dict[str, t.Dict[str, QueueMetrics]] = defaultdict(
+            lambda: defaultdict(QueueMetrics)
+        )
+        self._pipelines: t.Dict[str, t.List[t.Any]] = defaultdict(list)
+        self.memory_budget: t.Optional[t.Any] = None
+        self.sources: t.Optional[t.Any] = None
+
+    def observe(self, table_name: str, stage: str, started_at: float, rows: int):
+        """Add a chunk processed by the stage since started_at (perf_counter)."""
+        self.stages[table_name][stage].observe(started_at, time.perf_counter(), rows)
+
+    def watch(self, table_name: str, pipeline: t.Any) -> None:
+        self._pipelines[table_name].append(pipeline)
+
+    def unwatch(self, table_name: str, pipeline: t.Any) -> None:
+        self._pipelines[table_name].remove(pipeline)
+
+    def sample_queues(self) -> None:
+        """Save depths of the queues of running pipelines summed by tables."""
+        for table_name, pipelines in self._pipelines.items():
+            if not pipelines:
+                continue
+
+            for queue in self.QUEUES:
+                self.queues[table_name][queue].observe(
+                    sum(getattr(i, queue).qsize() for i in pipelines)
+                )
+
+    @staticmethod
+    def get_peak_rss() -> t.Dict[str, int]:
+        # ru_maxrss в килобайтах на linux и в байтах на macos
+        scale = 1 if sys.platform == "darwin" else 1024
+
+        return {
+            "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+        }
+
+    def summary(self) -> t.Dict[str, t.Any]:
+        summary = {
+            "wall_seconds": round(time.perf_counter() - self.started_at, 6),
+            "peak_rss_bytes": self.get_peak_rss(),
+            "tables": {
+                table_name: {
+                    "stages": {i: j.to_dict() for i, j in stages.items()},
+                    "queues": {
+                        i: j.to_dict() for i, j in self.queues[table_name].items()
+                    },
+                }
+                for table_name, stages in self.stages.items()
+            },
+        }
+
+        if self.memory_budget:
+            summary["memory_budget"] = self.memory_budget.to_dict()
+
+        if self.sources:
+            summary["sources"] = self.sources.to_dict()
+
+        return summary
+
+    def to_prometheus(self) -> str:
+        """Metrics in the prometheus text exposition format."""
+        lines = [
+            "# TYPE etl_rows_total counter",
+            "# TYPE etl_chunks_total counter",
+            "# TYPE etl_stage_busy_seconds_total counter",
+            "# TYPE etl_stage_wall_seconds gauge",
+            "# TYPE etl_chunk_latency_seconds histogram",
+        ]
+
+        for table_name, stages in self.stages.items():
+            for stage, metrics in stages.items():
+                labels = f'table="{table_name}",stage="{stage}"'
+                lines.extend(
+                    (
+                        f"etl_rows_total{{{labels}}} {metrics.rows}",
+                        f"etl_chunks_total{{{labels}}} {metrics.chunks}",
+                        f"etl_stage_busy_seconds_total{{{labels}}} "
+                        f"{metrics.busy_seconds}",
+                        f"etl_stage_wall_seconds{{{labels}}} {metrics.wall_seconds}",
+                    )
+                )
+
+                latency = metrics.latency
+
+                for bound, count in zip(latency.BUCKETS, latency.counts):
+                    lines.append(
+                        f'etl_chunk_latency_seconds_bucket{{{labels},le="{bound}"}} '
+                        f"{count}"
+                    )
+
+                lines.extend(
+                    (
+                        f'etl_chunk_latency_seconds_bucket{{{labels},le="+Inf"}} '
+                        f"{latency.count}",
+                        f"etl_chunk_latency_seconds_sum{{{labels}}} {latency.sum}",
+                        f"etl_chunk_latency_seconds_count{{{labels}}} {latency.count}",
+                    )
+                )
+
+        lines.extend(
+            ("# TYPE etl_queue_depth gauge", "# TYPE etl_queue_max_depth gauge")
+        )
+
+        for table_name, queues in self.queues.items():
+            for queue, metrics in queues.items():
+                labels = f'table="{table_name}",queue="{queue}"'
+                lines.append(f"etl_queue_depth{{{labels}}} {metrics.depth}")
+                lines.append(f"etl_queue_max_depth{{{labels}}} {metrics.max_depth}")
+
+        lines.append("# TYPE etl_peak_rss_bytes gauge")
+
+        for process, value in self.get_peak_rss().items():
+            lines.append(f'etl_peak_rss_bytes{{process="{process}"}} {value}')
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        # Файл подменяется целиком, чтобы node exporter не прочитал его наполовину.
+        tmp_path = f"{path}.tmp"
+
+        with open(tmp_path, "w") as file:
+            file.write(self.to_prometheus())
+
+        os.replace(tmp_path, path)
+
+    def write_summary(self, path: str) -> None:
+        with open(path, "w") as file:
+            file.write(ujson.dumps(self.summary(), indent=2))
+
+    async def run_sampler(
+        self, interval: float, prometheus_path: t.Optional[str] = None
+    ) -> None:
+        """Sample queues and write the prometheus file every interval seconds."""
+        while True:
+            self.sample_queues()
+
+            if prometheus_path:
+                try:
+                    self.write_prometheus(prometheus_path)
+                except OSError as err:
+                    logger.warning("Failed to write metrics. Error: %s", err)
+
+            await asyncio.sleep(interval)
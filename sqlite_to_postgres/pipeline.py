@@ -0,0 +1,156 @@
+import asyncio
+import typing as t
+
+Chunk = t.Any
+
+
+class PipelineStop:
+    """Queue item that tells a worker there is nothing more to process."""
+
+
+class MemoryBudget:
+    """
+    Bytes of chunks in flight shared by all pipelines. A pipeline takes the
+    size of a chunk before it is passed to the transform and gives it back
+    after the load, a chunk waits while the budget is spent by others. A chunk
+    bigger than the whole budget still goes alone, so nothing waits forever.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self.waits = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, size: int) -> None:
+        async with self._condition:
+            if self.used and self.used + size > self.limit:
+                self.waits += 1
+                await self._condition.wait_for(
+                    lambda: not self.used or self.used + size <= self.limit
+                )
+
+            self.used += size
+            self.peak = max(self.peak, self.used)
+
+    async def release(self, size: int) -> None:
+        async with self._condition:
+            self.used -= size
+            self._condition.notify_all()
+
+    def to_dict(self) -> t.Dict[str, int]:
+        return {
+            "limit_bytes": self.limit,
+            "peak_bytes": self.peak,
+            "waits": self.waits,
+        }
+
+
+class Pipeline:
+    """
+    Run extract, transform and load of chunks as concurrent stages.
+
+    One reader task takes chunks from the source, transform workers and loader
+    tasks take them from bounded queues. A full queue blocks the previous stage,
+    so at most queue_size chunks wait between two stages. The first error in
+    any stage cancels the whole pipeline and is raised from run().
+
+    With memory_budget every chunk takes weigh(chunk) bytes of the budget from
+    the read until the end of its load.
+    """
+
+    def __init__(
+        self,
+        source: t.AsyncIterable[Chunk],
+        transform: t.Callable[[Chunk], t.Awaitable[Chunk]],
+        load: t.Callable[[Chunk], t.Awaitable[None]],
+        transform_workers: int = 1,
+        load_workers: int = 1,
+        queue_size: int = 1,
+        memory_budget: t.Optional[MemoryBudget] = None,
+        weigh: t.Optional[t.Callable[[Chunk], int]] = None,
+    ):
+        self.source = source
+        self.transform = transform
+        self.load = load
+        self.transform_workers = max(transform_workers, 1)
+        self.load_workers = max(load_workers, 1)
+        self.transform_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.load_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.memory_budget = memory_budget
+        self.weigh = weigh
+        self._running_transformers = self.transform_workers
+        self._acquired = 0
+
+    async def run(self) -> None:
+        tasks = [
+            asyncio.create_task(self._read()),
+            *[
+                asyncio.create_task(self._transform())
+                for _ in range(self.transform_workers)
+            ],
+            *[asyncio.create_task(self._load()) for _ in range(self.load_workers)],
+        ]
+
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            # Пачки упавшего пайплайна не должны держать бюджет других таблиц.
+            if self._acquired:
+                await self.memory_budget.release(self._acquired)
+                self._acquired = 0
+
+        for task in done:
+            if task.exception():
+                raise task.exception()
+
+    async def _read(self) -> None:
+        async for chunk in self.source:
+            weight = 0
+
+            if self.memory_budget:
+                weight = self.weigh(chunk) if self.weigh else 0
+                await self.memory_budget.acquire(weight)
+                self._acquired += weight
+
+            await self.transform_queue.put((weight, chunk))
+
+        for _ in range(self.transform_workers):
+            await self.transform_queue.put(PipelineStop)
+
+    async def _transform(self) -> None:
+        while True:
+            item = await self.transform_queue.get()
+
+            if item is PipelineStop:
+                break
+
+            weight, chunk = item
+            await self.load_queue.put((weight, await self.transform(chunk)))
+
+        self._running_transformers -= 1
+
+        # Последний воркер трансформации останавливает загрузчиков.
+        if not self._running_transformers:
+            for _ in range(self.load_workers):
+                await self.load_queue.put(PipelineStop)
+
+    async def _load(self) -> None:
+        while True:
+            item = await self.load_queue.get()
+
+            if item is PipelineStop:
+                break
+
+            weight, chunk = item
+            await self.load(chunk)
+
+            if weight:
+                await self.memory_budget.release(weight)
+                self._acquired -= weight
@@ -0,0 +1,252 @@
+import re
+import typing as t
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from operator import attrgetter
+from uuid import UUID
+
+from pydantic.fields import ModelField
+from pydantic.main import BaseModel
+
+from schemas import SchemaByTableEnum
+
+
+def _as_aware_datetime(value: datetime) -> datetime:
+    # timestamptz в бинарном протоколе - это смещение от UTC, naive datetime
+    # asyncpg посчитал бы локальным временем.
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+
+    return value
+
+
+def _as_date(value: date) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+
+    return value
+
+
+class RecordCodec:
+    """
+    Convert schema instances to tuples ready for the binary COPY.
+
+    Columns go in the schema field order. Pydantic already gives us the python
+    types asyncpg expects (UUID, datetime, date, float, bool, str), so only the
+    fields that need normalization get an encoder.
+    """
+
+    ENCODERS: t.Dict[type, t.Callable[[t.Any], t.Any]] = {
+        datetime: _as_aware_datetime,
+        date: _as_date,
+    }
+
+    def __init__(self, schema: t.Type[BaseModel]):
+        self.columns: t.Tuple[str, ...] = tuple(schema.__fields__)
+        self._getter = attrgetter(*self.columns)
+        self._encoders = tuple(
+            (index, self.ENCODERS[field.type_])
+            for index, field in enumerate(schema.__fields__.values())
+            if self.is_encoded(field)
+        )
+
+    @classmethod
+    def is_encoded(cls, field: ModelField) -> bool:
+        return field.type_ in cls.ENCODERS
+
+    def encode(self, data: BaseModel) -> t.Tuple[t.Any, ...]:
+        record = self._getter(data)
+
+        if not self._encoders:
+            return record
+
+        record = list(record)
+
+        for index, encoder in self._encoders:
+            if record[index] is not None:
+                record[index] = encoder(record[index])
+
+        return tuple(record)
+
+    def encode_many(self, data: t.Iterable[BaseModel]) -> t.List[t.Tuple[t.Any, ...]]:
+        return [self.encode(i) for i in data]
+
+
+@lru_cache()
+def get_codec(table_name: str) -> RecordCodec:
+    return RecordCodec(SchemaByTableEnum[table_name].value)
+
+
+# Строки, которые fromisoformat и pydantic разбирают одинаково. Остальное,
+# например "20210616" (для pydantic это unix время) или дату без времени
+# в поле datetime, fromisoformat с python 3.11 разбирает иначе, их
+# проверяет pydantic.
+DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}\Z", re.ASCII)
+DATETIME_RE = re.compile(
+    r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(\.\d{1,6})?([+-]\d{2}(:\d{2})?)?\Z",
+    re.ASCII,
+)
+
+
+class FastPathError(ValueError):
+    pass
+
+
+def _check_str(value: t.Any) -> str:
+    if value.__class__ is not str:
+        raise FastPathError(value)
+
+    return value
+
+
+def _check_uuid(value: t.Any, version: t.Optional[int]) -> UUID:
+    value = UUID(_check_str(value))
+
+    if version is not None and value.version != version:
+        raise FastPathError(value)
+
+    return value
+
+
+def _check_datetime(value: t.Any) -> datetime:
+    value = _check_str(value)
+
+    if not DATETIME_RE.match(value):
+        raise FastPathError(value)
+
+    # sqlite отдает смещение как "+00", fromisoformat до python 3.11 понимает
+    # только "+00:00".
+    if value[-3] in "+-":
+        value += ":00"
+
+    return _as_aware_datetime(datetime.fromisoformat(value))
+
+
+def _check_date(value: t.Any) -> date:
+    value = _check_str(value)
+
+    if not DATE_RE.match(value):
+        raise FastPathError(value)
+
+    return date.fromisoformat(value)
+
+
+def _check_float(value: t.Any) -> float:
+    if value.__class__ is not float and value.__class__ is not int:
+        raise FastPathError(value)
+
+    return float(value)
+
+
+def _check_bool(value: t.Any) -> bool:
+    if value is True or value is False:
+        return value
+
+    if value.__class__ is not int or value not in (0, 1):
+        raise FastPathError(value)
+
+    return value == 1
+
+
+class RowConverter:
+    """
+    Convert raw rows to records without building dicts and pydantic models.
+
+    For every schema a tuple-in/tuple-out function is generated with a check
+    per field. The checks accept only the plain values sqlite gives us, so
+    a row that fails any of them is validated by pydantic as before.
+    """
+
+    CHECKS: t.Dict[type, str] = {
+        str: "check_str({value})",
+        datetime: "check_datetime({value})",
+        date: "check_date({value})",
+        float: "check_float({value})",
+        bool: "check_bool({value})",
+    }
+    NAMESPACE = {
+        "check_str": _check_str,
+        "check_uuid": _check_uuid,
+        "check_datetime": _check_datetime,
+        "check_date": _check_date,
+        "check_float": _check_float,
+        "check_bool": _check_bool,
+    }
+
+    def __init__(self, schema: t.Type[BaseModel], codec: RecordCodec):
+        self.schema = schema
+        self.codec = codec
+        self.source = self.generate_source(schema)
+        self._convert: t.Optional[t.Callable] = None
+
+        if self.source:
+            namespace = dict(self.NAMESPACE)
+            exec(
+                compile(self.source, f"<{schema.__name__} converter>", "exec"),
+                namespace,
+            )
+            self._convert = namespace["convert"]
+
+    @classmethod
+    def get_check(cls, field: ModelField, value: str) -> t.Optional[str]:
+        if issubclass(field.type_, UUID):
+            version = getattr(field.type_, "_required_version", None)
+            check = f"check_uuid({value}, {version})"
+        elif field.type_ in cls.CHECKS:
+            check = cls.CHECKS[field.type_].format(value=value)
+        else:
+            return None
+
+        if field.allow_none:
+            return f"None if {value} is None else {check}"
+
+        return check
+
+    @classmethod
+    def generate_source(cls, schema: t.Type[BaseModel]) -> t.Optional[str]:
+        """Source of the convert(row) function, None if a field isn't supported."""
+        values = [f"v{i}" for i in range(len(schema.__fields__))]
+        checks = []
+
+        for field, value in zip(schema.__fields__.values(), values):
+            check = cls.get_check(field, value)
+
+            if check is None:
+                return None
+
+            checks.append(f"        {check},")
+
+        return "\n".join(
+            (
+                "def convert(row):",
+                f"    {', '.join(values)}, = row",
+                "    return (",
+                *checks,
+                "    )",
+            )
+        )
+
+    def fallback(self, row: t.Sequence[t.Any]) -> t.Tuple[t.Any, ...]:
+        return self.codec.encode(self.schema(**dict(zip(self.codec.columns, row))))
+
+    def convert_many(
+        self, rows: t.Iterable[t.Sequence[t.Any]]
+    ) -> t.List[t.Tuple[t.Any, ...]]:
+        if not self._convert:
+            return [self.fallback(row) for row in rows]
+
+        convert = self._convert
+        records = []
+
+        for row in rows:
+            try:
+                records.append(convert(row))
+            except (TypeError, ValueError, AttributeError, IndexError):
+                records.append(self.fallback(row))
+
+        return records
+
+
+@lru_cache()
+def get_converter(table_name: str) -> RowConverter:
+    return RowConverter(SchemaByTableEnum[table_name].value, get_codec(table_name))
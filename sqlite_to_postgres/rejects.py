@@ -0,0 +1,67 @@
+import os
+import typing as t
+from datetime import date, datetime
+from uuid import UUID
+
+import ujson
+
+from db_clients import RejectedRecord
+
+
+class RejectWriter:
+    """
+    Append rows rejected by the target db to a NDJSON file. Every line has
+    the table, the row by columns and the db error, so the rows can be fixed
+    and loaded again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+
+    @staticmethod
+    def to_json(value: t.Any) -> t.Any:
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+
+        if isinstance(value, UUID):
+            return str(value)
+
+        return value
+
+    def write(
+        self,
+        table_name: str,
+        columns: t.Sequence[str],
+        rejected: t.Iterable[RejectedRecord],
+    ) -> None:
+        rejected_at = datetime.now().astimezone().isoformat()
+        lines = [
+            ujson.dumps(
+                {
+                    "table": table_name,
+                    "record": {
+                        column: self.to_json(value)
+                        for column, value in zip(columns, record)
+                    },
+                    "error": error,
+                    "rejected_at": rejected_at,
+                },
+                ensure_ascii=False,
+            )
+            for record, error in rejected
+        ]
+
+        if not lines:
+            return
+
+        directory = os.path.dirname(self.path)
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Одна запись на пачку: строки разных таблиц не перемешиваются.
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+
+        self.count += len(lines)
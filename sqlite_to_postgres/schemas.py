@@ -1,5 +1,5 @@
 import typing as t
-from datetime import datetime
+from datetime import date, datetime
 from enum import Enum
 
 from pydantic import BaseModel
@@ -10,7 +10,7 @@ class FilmWorkSchema(BaseModel):
     id: UUID4
     title: str
     description: t.Optional[str]
-    creation_date: t.Optional[str]
+    creation_date: t.Optional[date]
     certificate: t.Optional[str]
     file_path: t.Optional[str]
     rating: t.Optional[float] = 0.0
@@ -46,7 +46,7 @@ class GenreSchema(BaseModel):
 class PersonSchema(BaseModel):
     id: UUID4
     full_name: str
-    birth_date: t.Optional[datetime]
+    birth_date: t.Optional[date]
     created_at: datetime
     updated_at: datetime
 
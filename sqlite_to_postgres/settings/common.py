@@ -1,3 +1,4 @@
+import typing as t
 from logging import config
 
 from pydantic import BaseSettings
@@ -8,12 +9,85 @@ class TargetDBSettings(BaseSettings):
     SCHEMA: str = "content"
     MIN_POOL_SIZE: int = 5
     MAX_POOL_SIZE: int = 10
+    WATERMARK_TABLE: str = "etl_watermark"
+    CHECKPOINT_TABLE: str = "etl_checkpoint"
+    DEFERRED_INDEX_TABLE: str = "etl_deferred_index"
 
 
 class ETLSettings(BaseSettings):
     TARGET_DB = TargetDBSettings()
     SOURCE_DB_DSN: str = "db.sqlite"
+    # Several sqlite files or glob patterns as a json list, SOURCE_DB_DSN is used
+    # when it is empty. Sources are loaded concurrently into one postgres pool,
+    # SOURCE_CONCURRENCY sources at once with at most SOURCE_PIPELINES pipelines
+    # of tables and shards each. A key found in several sources is loaded once,
+    # from the source with the latest row. Checkpoints and watermarks are kept
+    # by tables, so full mode doesn't resume and incremental mode upserts whole
+    # sources. Progress of all sources is logged every SOURCE_PROGRESS_INTERVAL.
+    SOURCE_DBS: t.List[str] = []
+    SOURCE_CONCURRENCY: int = 4
+    SOURCE_PIPELINES: int = 4
+    SOURCE_PROGRESS_INTERVAL: float = 5.0
     CHUNK_SIZE: int = 500
+    # The chunk size of every table follows the load latency: CHUNK_SIZE is the
+    # first size, a chunk is loaded in about CHUNK_TARGET_SECONDS and chunks of
+    # a table in flight take at most CHUNK_MEMORY_BUDGET bytes.
+    ADAPTIVE_CHUNK_SIZE: bool = True
+    MIN_CHUNK_SIZE: int = 100
+    MAX_CHUNK_SIZE: int = 50_000
+    CHUNK_TARGET_SECONDS: float = 0.25
+    CHUNK_MEMORY_BUDGET: int = 64 * 1024 * 1024
+    # Bytes of chunks in flight of all tables together. A table waits for the
+    # memory taken by others before it reads the next chunk, chunk sizes of
+    # tables share the budget. Not limited by default.
+    MEMORY_BUDGET: t.Optional[int] = None
+    # offset | keyset | stream, see db_clients.FetchModeEnum
+    FETCH_MODE: str = "keyset"
+    # text | binary, see db_clients.LoadMethodEnum
+    LOAD_METHOD: str = "binary"
+    # full | incremental | export | snapshot, see main.ETLModeEnum.
+    # export writes validated tables to Arrow files in SNAPSHOT_DIR,
+    # snapshot loads them to postgres without sqlite.
+    MODE: str = "full"
+    SNAPSHOT_DIR: str = "snapshot"
+    # Pipeline of every table: reader -> TRANSFORM_WORKERS -> LOAD_WORKERS,
+    # at most QUEUE_SIZE chunks wait between two stages.
+    TRANSFORM_WORKERS: int = 2
+    LOAD_WORKERS: int = 2
+    QUEUE_SIZE: int = 4
+    # A table with more rows is split to up to MAX_SHARDS key ranges,
+    # each range is read by its own sqlite connection into its own pipeline.
+    SHARD_SIZE: int = 100_000
+    MAX_SHARDS: int = 4
+    # none | thread | process, see transformers.ExecutorEnum.
+    # Workers count defaults to the cpu count for the process pool.
+    TRANSFORM_EXECUTOR: str = "process"
+    TRANSFORM_EXECUTOR_WORKERS: t.Optional[int] = None
+    # Generated converters from record_codecs, pydantic only for rejected rows
+    FAST_TRANSFORM: bool = True
+    # Full mode saves every loaded chunk and a restarted run skips them.
+    # Turn it off to empty the target tables, forget the saved progress
+    # and load from scratch, the way several sources are always loaded.
+    RESUME: bool = True
+    # A chunk that fails to load is split in halves until its bad rows are found,
+    # they are appended to REJECT_FILE and the rest of the chunk is loaded.
+    BISECT_FAILED_CHUNKS: bool = True
+    REJECT_FILE: str = "rejects.ndjson"
+    # Link rows are checked against keys of their parent tables before the load,
+    # off | report | quarantine, see integrity.IntegrityCheckEnum. Rows with
+    # missing parents are appended to ORPHAN_FILE, quarantine doesn't load them.
+    INTEGRITY_CHECK: str = "quarantine"
+    ORPHAN_FILE: str = "orphans.ndjson"
+    # Full mode drops secondary indexes before the load and builds them after it
+    DEFER_INDEXES: bool = True
+    # Full and snapshot modes turn off triggers of the api read model and
+    # rebuild it once after the load, incremental mode keeps them on
+    REFRESH_READ_MODEL: bool = True
+    # Summary of stage timings is logged at the end of the run and can be
+    # written as json. The prometheus text file is rewritten while etl runs.
+    METRICS_INTERVAL: float = 1.0
+    METRICS_FILE: t.Optional[str] = None
+    PROMETHEUS_FILE: t.Optional[str] = None
 
     class Config:
         env_prefix = "ETL_"
@@ -0,0 +1,144 @@
+import os
+import typing as t
+from datetime import date, datetime
+from functools import lru_cache
+from logging import getLogger
+from uuid import UUID
+
+import pyarrow as pa
+
+from record_codecs import get_codec
+from schemas import SchemaByTableEnum
+
+logger = getLogger(__name__)
+
+# uuid хранится 16 байтами, а не строкой из 36 символов.
+ARROW_TYPES: t.Tuple[t.Tuple[type, pa.DataType], ...] = (
+    (UUID, pa.binary(16)),
+    (datetime, pa.timestamp("us", tz="UTC")),
+    (date, pa.date32()),
+    (bool, pa.bool_()),
+    (float, pa.float64()),
+    (str, pa.string()),
+)
+
+
+class SnapshotError(Exception):
+    pass
+
+
+@lru_cache()
+def get_arrow_schema(table_name: str) -> pa.Schema:
+    """Arrow schema of the table in the order of its codec columns."""
+    fields = SchemaByTableEnum[table_name].value.__fields__
+    arrow_fields = []
+
+    for column in get_codec(table_name).columns:
+        field = fields[column]
+        arrow_type = next(j for i, j in ARROW_TYPES if issubclass(field.type_, i))
+        arrow_fields.append(pa.field(column, arrow_type, nullable=field.allow_none))
+
+    return pa.schema(arrow_fields, metadata={"table": table_name})
+
+
+def get_snapshot_path(directory: str, table_name: str) -> str:
+    return os.path.join(directory, f"{table_name}.arrow")
+
+
+class SnapshotWriter:
+    """
+    Write validated records of a table to an Arrow IPC file, one record batch
+    per chunk. The file gets its name on close(), so an interrupted export
+    never looks like a finished snapshot.
+    """
+
+    def __init__(self, directory: str, table_name: str):
+        self.table_name = table_name
+        self.path = get_snapshot_path(directory, table_name)
+        self.schema = get_arrow_schema(table_name)
+        self.rows = 0
+        os.makedirs(directory, exist_ok=True)
+        self._tmp_path = f"{self.path}.tmp"
+        self._writer = pa.ipc.new_file(self._tmp_path, self.schema)
+
+    def write(self, records: t.Sequence[t.Tuple[t.Any, ...]]) -> None:
+        if not records:
+            return
+
+        columns = []
+
+        for field, values in zip(self.schema, zip(*records)):
+            if field.type == pa.binary(16):
+                values = [i.bytes if i is not None else None for i in values]
+
+            columns.append(pa.array(values, type=field.type))
+
+        self._writer.write_batch(
+            pa.RecordBatch.from_arrays(columns, schema=self.schema)
+        )
+        self.rows += len(records)
+
+    def close(self) -> None:
+        self._writer.close()
+        os.replace(self._tmp_path, self.path)
+        logger.debug(
+            "%s rows of %s table are saved to %s", self.rows, self.table_name, self.path
+        )
+
+    def abort(self) -> None:
+        self._writer.close()
+        os.remove(self._tmp_path)
+
+
+class SnapshotReader:
+    """
+    Read a table snapshot through a memory map. Batches are sliced without
+    copying, values become python objects only in to_records().
+    """
+
+    def __init__(self, directory: str, table_name: str):
+        self.table_name = table_name
+        self.path = get_snapshot_path(directory, table_name)
+
+        if not os.path.exists(self.path):
+            raise SnapshotError(f"No snapshot of {table_name} table in {directory}")
+
+        self._source = pa.memory_map(self.path)
+        self._reader = pa.ipc.open_file(self._source)
+
+        if (
+            self._reader.schema.remove_metadata()
+            != get_arrow_schema(table_name).remove_metadata()
+        ):
+            raise SnapshotError(f"Snapshot {self.path} has another schema")
+
+    def iter_batches(
+        self, rows_limit: t.Callable[[], int]
+    ) -> t.Iterator[pa.RecordBatch]:
+        """Batches of about rows_limit() rows, it is called before every batch."""
+        for index in range(self._reader.num_record_batches):
+            batch = self._reader.get_batch(index)
+            offset = 0
+
+            while offset < batch.num_rows:
+                size = rows_limit()
+                yield batch.slice(offset, size)
+                offset += size
+
+    @staticmethod
+    def to_records(batch: pa.RecordBatch) -> t.List[t.Tuple[t.Any, ...]]:
+        """Records for the binary COPY in the order of the codec columns."""
+        columns = []
+
+        for field, column in zip(batch.schema, batch.columns):
+            values = column.to_pylist()
+
+            if field.type == pa.binary(16):
+                values = [UUID(bytes=i) if i is not None else None for i in values]
+
+            columns.append(values)
+
+        return list(zip(*columns))
+
+    def close(self) -> None:
+        self._source.close()
@@ -0,0 +1,147 @@
+import glob
+import heapq
+import itertools
+import os
+import sqlite3
+import time
+import typing as t
+from operator import itemgetter
+
+from db_clients import SQLiteDBClient
+
+
+class SourceError(Exception):
+    pass
+
+
+class Source(t.NamedTuple):
+    index: int
+    path: str
+
+
+class SourceKeys(t.NamedTuple):
+    """Rows of the table by sources and keys every source leaves to others."""
+
+    rows: t.List[int]
+    duplicates: t.List[t.Set[str]]
+
+
+def get_sources(patterns: t.Sequence[str]) -> t.List[Source]:
+    """
+    Sqlite files of the paths and glob patterns in the given order, files of
+    a pattern are sorted by name. A file matched twice is loaded once.
+    """
+    paths: t.List[str] = []
+    seen: t.Set[str] = set()
+
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+
+        if not matches:
+            # sqlite молча создаст пустую бд вместо опечатки в пути.
+            raise SourceError(f"No sqlite files match {pattern}")
+
+        for path in matches:
+            real_path = os.path.realpath(path)
+
+            if real_path not in seen:
+                seen.add(real_path)
+                paths.append(path)
+
+    return [Source(index, path) for index, path in enumerate(paths)]
+
+
+def iter_keys(
+    path: str, table_name: str, order_field: str, index: int
+) -> t.Iterator[t.Tuple[str, str, int]]:
+    """Keys of the table in the key order with the row version and the source."""
+    key = SQLiteDBClient.KEY_FIELD
+    connection = sqlite3.connect(path)
+
+    try:
+        cursor = connection.execute(
+            f"SELECT {key}, {order_field} FROM {table_name} ORDER BY {key}"
+        )
+
+        while True:
+            rows = cursor.fetchmany(SQLiteDBClient.ROWS_LIMIT)
+
+            if not rows:
+                break
+
+            for row_key, version in rows:
+                yield row_key, version or "", index
+    except sqlite3.Error as err:
+        raise SourceError(f"{path}: {table_name}: {err}") from None
+    finally:
+        connection.close()
+
+
+def find_duplicate_keys(
+    paths: t.Sequence[str], table_name: str, order_field: str
+) -> SourceKeys:
+    """
+    Merge sorted keys of the table from all sources. A key found in several
+    sources is loaded from the one with the latest order_field, the later
+    source wins a tie. Only the duplicates are kept in memory.
+    """
+    rows = [0] * len(paths)
+    duplicates: t.List[t.Set[str]] = [set() for _ in paths]
+    streams = [
+        iter_keys(path, table_name, order_field, index)
+        for index, path in enumerate(paths)
+    ]
+
+    # merge сравнивает кортежи целиком, поэтому в группе ключа последней
+    # идет самая свежая строка.
+    for key, group in itertools.groupby(heapq.merge(*streams), key=itemgetter(0)):
+        versions = list(group)
+
+        for _, _, index in versions:
+            rows[index] += 1
+
+        for _, _, index in versions[:-1]:
+            duplicates[index].add(key)
+
+    return SourceKeys(rows, duplicates)
+
+
+class SourceProgress:
+    """Rows of all sources to load and loaded ones, for the log and metrics."""
+
+    def __init__(self, sources: t.Sequence[Source]):
+        self.sources = sources
+        self.rows = [0] * len(sources)
+        self.loaded = [0] * len(sources)
+        self.duplicates = 0
+        self.failed: t.Set[int] = set()
+        self.started_at = time.perf_counter()
+
+    def add(self, source_keys: SourceKeys) -> None:
+        for index, (rows, duplicates) in enumerate(
+            zip(source_keys.rows, source_keys.duplicates)
+        ):
+            self.rows[index] += rows - len(duplicates)
+            self.duplicates += len(duplicates)
+
+    def advance(self, index: int, rows: int) -> None:
+        self.loaded[index] += rows
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        rows, loaded = sum(self.rows), sum(self.loaded)
+        seconds = time.perf_counter() - self.started_at
+        rows_per_second = loaded / seconds if seconds else 0
+
+        return {
+            "sources": len(self.sources),
+            "finished": sum(i >= j for i, j in zip(self.loaded, self.rows)),
+            "failed": len(self.failed),
+            "rows": rows,
+            "loaded_rows": loaded,
+            "duplicate_rows": self.duplicates,
+            "percent": round(100 * loaded / rows, 1) if rows else 100.0,
+            "rows_per_second": round(rows_per_second),
+            "eta_seconds": (
+                round((rows - loaded) / rows_per_second, 1) if rows_per_second else None
+            ),
+        }
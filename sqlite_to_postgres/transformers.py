@@ -0,0 +1,60 @@
+import os
+import typing as t
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from enum import Enum
+
+from pydantic import ValidationError
+
+from record_codecs import get_converter
+
+
+class TransformError(Exception):
+    pass
+
+
+class ExecutorEnum(str, Enum):
+    none = "none"
+    thread = "thread"
+    process = "process"
+
+
+def create_executor(
+    executor: ExecutorEnum, max_workers: t.Optional[int] = None
+) -> t.Optional[Executor]:
+    """Create a pool for the transform stage, None means the event loop thread."""
+    if executor == ExecutorEnum.process:
+        return ProcessPoolExecutor(max_workers=max_workers or os.cpu_count())
+
+    if executor == ExecutorEnum.thread:
+        return ThreadPoolExecutor(max_workers=max_workers)
+
+    return None
+
+
+def transform_rows(
+    table_name: str,
+    rows: t.Iterable[t.Sequence[t.Any]],
+    as_records: bool = True,
+    fast: bool = True,
+) -> t.Union[t.List[t.Dict[str, t.Any]], t.List[t.Tuple[t.Any, ...]]]:
+    """
+    Validate raw rows with the table schema and prepare them for the load.
+    Rows must have values in the order of the table codec columns. With fast
+    the generated converter is used and pydantic only checks the rows it rejects.
+    """
+    converter = get_converter(table_name)
+
+    try:
+        if fast:
+            records = converter.convert_many(rows)
+        else:
+            records = [converter.fallback(row) for row in rows]
+    except ValidationError as err:
+        # Ошибки пидантика плохо переживают pickle, а эта функция работает
+        # и в дочерних процессах.
+        raise TransformError(f"{table_name}: {err}") from None
+
+    if as_records:
+        return records
+
+    return [dict(zip(converter.codec.columns, i)) for i in records]
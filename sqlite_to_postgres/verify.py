@@ -0,0 +1,351 @@
+"""
+Verify that the target db has the same rows as the sqlite source.
+
+    python verify.py [--tables film_work person] [--ranges 64]
+
+Rows of every table are hashed by ranges of the primary key on both sides at
+once: postgres sums hashes of its rows in sql, sqlite rows are streamed and
+hashed in a process pool. Only ranges with different sums are split further,
+rows are compared one by one only in small ranges.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import sqlite3
+import sys
+import typing as t
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import date, datetime, timezone
+from logging import getLogger
+from uuid import UUID
+
+import ujson
+
+from db_clients import PostgresDBClient, SQLiteDBClient, TableNameEnum
+from record_codecs import get_codec, get_converter
+from schemas import SchemaByTableEnum
+
+logger = getLogger(__name__)
+
+KEY_SPACE = 1 << 128
+NULL = "\\N"
+SEPARATOR = "\x1f"
+# Одинаковое текстовое представление значений на обеих сторонах: postgres
+# приводит колонку к тексту в sql, python - значение после трансформации.
+SQL_TEXT: t.Tuple[t.Tuple[type, str], ...] = (
+    (UUID, "{column}::text"),
+    (datetime, "to_char({column} AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS.US')"),
+    (date, "to_char({column}, 'YYYY-MM-DD')"),
+    (bool, "{column}::text"),
+    (float, "{column}::text"),
+    (str, "{column}::text"),
+)
+
+
+class RangeHash(t.NamedTuple):
+    count: int
+    hash_sum: int
+
+
+class KeyRange(t.NamedTuple):
+    """Range of uuid keys as ints, lower is included and upper is not."""
+
+    lower: int
+    upper: int
+
+    @staticmethod
+    def to_key(value: int) -> t.Optional[str]:
+        return str(UUID(int=value)) if value < KEY_SPACE else None
+
+    @property
+    def keys(self) -> t.Tuple[t.Optional[str], t.Optional[str]]:
+        return self.to_key(self.lower), self.to_key(self.upper)
+
+    def split(self, parts: int) -> t.List["KeyRange"]:
+        step = max((self.upper - self.lower) // parts, 1)
+        bounds = list(range(self.lower, self.upper, step))[:parts] + [self.upper]
+
+        return [KeyRange(i, j) for i, j in zip(bounds, bounds[1:])]
+
+
+class TableDiff(t.NamedTuple):
+    table_name: str
+    rows: int
+    ranges: t.List[t.Tuple[t.Optional[str], t.Optional[str]]]
+    missing: t.List[str]
+    extra: t.List[str]
+    changed: t.List[str]
+
+    @property
+    def ok(self) -> bool:
+        return not (self.ranges or self.missing or self.extra or self.changed)
+
+
+def get_row_hash_sql(table_name: str) -> str:
+    """Sql expression with the same hash of a row as get_row_hash() gives."""
+    fields = SchemaByTableEnum[table_name].value.__fields__
+    columns = []
+
+    for column in get_codec(table_name).columns:
+        template = next(j for i, j in SQL_TEXT if issubclass(fields[column].type_, i))
+        columns.append(f"coalesce({template.format(column=column)}, E'\\\\N')")
+
+    row_text = f"concat_ws(E'\\x1f', {', '.join(columns)})"
+
+    return f"('x' || substr(md5({row_text}), 1, 16))::bit(64)::bigint"
+
+
+def to_text(value: t.Any) -> str:
+    if value is None:
+        return NULL
+
+    if isinstance(value, bool):
+        return "true" if value else "false"
+
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+    if isinstance(value, date):
+        return value.isoformat()
+
+    if isinstance(value, float):
+        # postgres пишет 8 там, где python пишет 8.0
+        text = repr(value)
+        return text[:-2] if text.endswith(".0") else text
+
+    return str(value)
+
+
+def get_row_hash(record: t.Sequence[t.Any]) -> int:
+    text = SEPARATOR.join(to_text(i) for i in record)
+    return int.from_bytes(hashlib.md5(text.encode()).digest()[:8], "big", signed=True)
+
+
+def iter_source_hashes(
+    db_path: str, table_name: str, key_range: KeyRange
+) -> t.Iterator[t.Tuple[str, int]]:
+    """Stream rows of the key range from sqlite and hash them after transform."""
+    converter = get_converter(table_name)
+    columns = get_codec(table_name).columns
+    index = columns.index(SQLiteDBClient.KEY_FIELD)
+    lower, upper = key_range.keys
+    clauses = [f"{SQLiteDBClient.KEY_FIELD} >= ?"]
+    params = [lower]
+
+    if upper is not None:
+        clauses.append(f"{SQLiteDBClient.KEY_FIELD} < ?")
+        params.append(upper)
+
+    query = (
+        f"SELECT {', '.join(columns)} FROM {table_name} WHERE {' AND '.join(clauses)}"
+    )
+    connection = sqlite3.connect(db_path)
+
+    try:
+        cursor = connection.execute(query, params)
+
+        while True:
+            rows = cursor.fetchmany(SQLiteDBClient.ROWS_LIMIT)
+
+            if not rows:
+                break
+
+            for row in rows:
+                try:
+                    record = converter.convert_many([row])[0]
+                except Exception:
+                    # Строка не проходит валидацию, в целевой бд ее быть не может.
+                    yield row[index], get_row_hash(("invalid", *row))
+                    continue
+
+                yield str(record[index]), get_row_hash(record)
+    finally:
+        connection.close()
+
+
+def hash_source_range(db_path: str, table_name: str, key_range: KeyRange) -> RangeHash:
+    count, hash_sum = 0, 0
+
+    for _, row_hash in iter_source_hashes(db_path, table_name, key_range):
+        count += 1
+        hash_sum += row_hash
+
+    return RangeHash(count, hash_sum)
+
+
+def hash_source_rows(
+    db_path: str, table_name: str, key_range: KeyRange
+) -> t.Dict[str, int]:
+    return dict(iter_source_hashes(db_path, table_name, key_range))
+
+
+class Verifier:
+    def __init__(
+        self,
+        target_db_client: PostgresDBClient,
+        executor: Executor,
+        ranges: int,
+        fanout: int,
+        leaf_rows: int,
+    ):
+        self.target_db_client = target_db_client
+        self.executor = executor
+        self.ranges = ranges
+        self.fanout = fanout
+        self.leaf_rows = leaf_rows
+        self.db_path = SQLiteDBClient.DB_NAME
+
+    async def hash_range(
+        self, table_name: str, key_range: KeyRange
+    ) -> t.Tuple[RangeHash, RangeHash]:
+        """Hashes of the key range in the source and in the target."""
+        source, target = await asyncio.gather(
+            asyncio.get_running_loop().run_in_executor(
+                self.executor, hash_source_range, self.db_path, table_name, key_range
+            ),
+            self.target_db_client.fetch_range_hash(
+                table_name, get_row_hash_sql(table_name), *key_range.keys
+            ),
+        )
+
+        return source, RangeHash(*target)
+
+    async def compare_rows(
+        self, table_name: str, key_range: KeyRange, diff: TableDiff
+    ) -> None:
+        source, target = await asyncio.gather(
+            asyncio.get_running_loop().run_in_executor(
+                self.executor, hash_source_rows, self.db_path, table_name, key_range
+            ),
+            self.target_db_client.fetch_row_hashes(
+                table_name, get_row_hash_sql(table_name), *key_range.keys
+            ),
+        )
+
+        diff.missing.extend(sorted(source.keys() - target.keys()))
+        diff.extra.extend(sorted(target.keys() - source.keys()))
+        diff.changed.extend(
+            sorted(i for i in source.keys() & target.keys() if source[i] != target[i])
+        )
+
+    async def verify_range(
+        self,
+        table_name: str,
+        key_range: KeyRange,
+        diff: TableDiff,
+        hashes: t.Optional[t.Tuple[RangeHash, RangeHash]] = None,
+    ) -> None:
+        source, target = hashes or await self.hash_range(table_name, key_range)
+
+        if source == target:
+            return
+
+        if (
+            max(source.count, target.count) <= self.leaf_rows
+            or key_range.upper - key_range.lower <= self.fanout
+        ):
+            diff.ranges.append(key_range.keys)
+            await self.compare_rows(table_name, key_range, diff)
+            return
+
+        await asyncio.gather(
+            *[
+                self.verify_range(table_name, i, diff)
+                for i in key_range.split(self.fanout)
+            ]
+        )
+
+    async def verify_table(self, table_name: str) -> TableDiff:
+        diff = TableDiff(table_name, 0, [], [], [], [])
+        key_ranges = KeyRange(0, KEY_SPACE).split(self.ranges)
+        hashes = await asyncio.gather(
+            *[self.hash_range(table_name, i) for i in key_ranges]
+        )
+        diff = diff._replace(rows=sum(i[0].count for i in hashes))
+
+        await asyncio.gather(
+            *[
+                self.verify_range(table_name, key_range, diff, range_hashes)
+                for key_range, range_hashes in zip(key_ranges, hashes)
+            ]
+        )
+
+        return diff
+
+
+def report(diffs: t.List[TableDiff], limit: int) -> None:
+    for diff in diffs:
+        if diff.ok:
+            logger.info("%s: %s rows match", diff.table_name, diff.rows)
+            continue
+
+        logger.error(
+            "%s: %s different key ranges, %s missing, %s extra, %s changed rows",
+            diff.table_name,
+            len(diff.ranges),
+            len(diff.missing),
+            len(diff.extra),
+            len(diff.changed),
+        )
+
+        for kind in ("missing", "extra", "changed"):
+            keys = getattr(diff, kind)
+
+            if keys:
+                logger.error("%s %s keys: %s", diff.table_name, kind, keys[:limit])
+
+
+async def verify(args: argparse.Namespace) -> t.List[TableDiff]:
+    target_db_client = PostgresDBClient()
+    await target_db_client.init_db()
+    executor = ProcessPoolExecutor(max_workers=args.workers)
+    verifier = Verifier(
+        target_db_client, executor, args.ranges, args.fanout, args.leaf_rows
+    )
+
+    try:
+        # Таблицы проверяются параллельно, запросы к postgres ограничены пулом.
+        return list(
+            await asyncio.gather(*[verifier.verify_table(i) for i in args.tables])
+        )
+    finally:
+        executor.shutdown()
+        await target_db_client.db_pool.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--tables",
+        nargs="+",
+        default=TableNameEnum.all_names(),
+        choices=TableNameEnum.all_names(),
+    )
+    parser.add_argument("--ranges", type=int, default=64, help="First key ranges")
+    parser.add_argument(
+        "--fanout", type=int, default=16, help="Parts of a different range"
+    )
+    parser.add_argument(
+        "--leaf-rows",
+        type=int,
+        default=1000,
+        help="Ranges with fewer rows are compared row by row",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="sqlite processes")
+    parser.add_argument("--limit", type=int, default=20, help="Keys in the log")
+    parser.add_argument("--report", help="Write differences to the json file")
+    args = parser.parse_args()
+
+    diffs = asyncio.run(verify(args))
+    report(diffs, args.limit)
+
+    if args.report:
+        with open(args.report, "w") as file:
+            file.write(ujson.dumps([i._asdict() for i in diffs], indent=2))
+
+    return int(not all(i.ok for i in diffs))
+
+
+if __name__ == "__main__":
+    sys.exit(main())